@@ -0,0 +1,259 @@
+"""Offline stand-in for the Spotify Web API and accounts service.
+
+Serves the endpoints Drolg uses (token exchange and refresh, me, search,
+track(s), playlist, playlist items, create playlist, add and reorder items)
+from an in-memory catalog, with configurable latency and injected 429s.
+Point the app at it with:
+
+    python benchmarks/fake_spotify.py --port 8900 --latency-ms 80 --jitter-ms 40 --rate-429 0.02
+    SPOTIFY_API_URL=http://127.0.0.1:8900/v1/ SPOTIFY_ACCOUNTS_URL=http://127.0.0.1:8900 ...
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+WORDS = [
+    'midnight', 'summer', 'neon', 'river', 'golden', 'electric', 'velvet', 'ocean',
+    'fire', 'paper', 'city', 'moon', 'wild', 'silver', 'dream', 'thunder', 'echo',
+    'shadow', 'sugar', 'highway', 'crystal', 'honey', 'storm', 'diamond', 'rebel',
+    'cherry', 'starlight', 'desert', 'ghost', 'paradise', 'satellite', 'violet'
+]
+
+
+def track_id(n):
+    return f'fake{n:018d}'
+
+
+def make_catalog(size, seed=7):
+    rng = random.Random(seed)
+    catalog = {}
+    for n in range(size):
+        tid = track_id(n)
+        catalog[tid] = {
+            'id': tid,
+            'name': f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}',
+            'artists': [{'id': f'artist{n % 500}', 'name': f'The {rng.choice(WORDS).title()}s'}],
+            'album': {'id': f'album{n % 2000}', 'name': f'{rng.choice(WORDS).title()} Sessions'},
+            'duration_ms': rng.randint(120000, 360000),
+            'uri': f'spotify:track:{tid}',
+            'type': 'track'
+        }
+    return catalog
+
+
+class FakeSpotify:
+    def __init__(self, catalog_size=5000, latency_ms=0, jitter_ms=0, rate_429=0.0, retry_after=1):
+        self.catalog = make_catalog(catalog_size)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.playlists = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def throttle(self):
+        with self.lock:
+            self.requests += 1
+            if self.rate_429 and random.random() < self.rate_429:
+                self.throttled += 1
+                return True
+        return False
+
+    def search(self, query, limit, offset):
+        terms = [term for term in query.lower().split() if term]
+        hits = [
+            track for track in self.catalog.values()
+            if all(term in track['name'].lower() or term in track['artists'][0]['name'].lower() for term in terms)
+        ]
+        return {'tracks': {
+            'items': hits[offset:offset + limit], 'limit': limit, 'offset': offset, 'total': len(hits)
+        }}
+
+    def create_playlist(self, owner, name):
+        with self.lock:
+            playlist_id = f'fakeplaylist{len(self.playlists):010d}'
+            self.playlists[playlist_id] = {'id': playlist_id, 'name': name, 'owner': owner, 'items': [], 'version': 0}
+        return self.playlist(playlist_id)
+
+    def _snapshot(self, playlist):
+        return f"{playlist['id']}-{playlist['version']}"
+
+    def playlist(self, playlist_id, fields=None):
+        playlist = self.playlists.get(playlist_id)
+        if playlist is None:
+            return None
+        if fields == 'snapshot_id':
+            return {'snapshot_id': self._snapshot(playlist)}
+        return {
+            'id': playlist_id,
+            'name': playlist['name'],
+            'snapshot_id': self._snapshot(playlist),
+            'tracks': self.playlist_items(playlist_id, 100, 0)
+        }
+
+    def playlist_items(self, playlist_id, limit, offset):
+        items = self.playlists[playlist_id]['items']
+        return {
+            'items': [{'track': self.catalog.get(tid)} for tid in items[offset:offset + limit]],
+            'limit': limit, 'offset': offset, 'total': len(items)
+        }
+
+    def add_items(self, playlist_id, uris):
+        with self.lock:
+            playlist = self.playlists[playlist_id]
+            playlist['items'].extend(uri.rsplit(':', 1)[-1] for uri in uris)
+            playlist['version'] += 1
+            return {'snapshot_id': self._snapshot(playlist)}
+
+    def reorder_items(self, playlist_id, range_start, insert_before, range_length=1):
+        with self.lock:
+            playlist = self.playlists[playlist_id]
+            items = playlist['items']
+            moved = items[range_start:range_start + range_length]
+            del items[range_start:range_start + range_length]
+            if insert_before > range_start:
+                insert_before -= range_length
+            items[insert_before:insert_before] = moved
+            playlist['version'] += 1
+            return {'snapshot_id': self._snapshot(playlist)}
+
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                return {key: values[0] for key, values in parse_qs(raw.decode()).items()}
+            return json.loads(raw) if raw else {}
+
+        def handle_any(self, method):
+            parts = urlsplit(self.path)
+            query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            path = [segment for segment in parts.path.split('/') if segment]
+            body = self.read_body() if method in ('POST', 'PUT') else {}
+
+            fake.delay()
+            if fake.throttle():
+                return self.send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                                      {'Retry-After': str(fake.retry_after)})
+
+            if path == ['api', 'token']:
+                code = body.get('code') or body.get('refresh_token', 'refresh').replace('refresh-', '')
+                return self.send_json(200, {
+                    'access_token': f'token-{code}', 'token_type': 'Bearer', 'expires_in': 3600,
+                    'refresh_token': f'refresh-{code}', 'scope': body.get('scope', '')
+                })
+            if not path or path[0] != 'v1':
+                return self.send_json(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+            path = path[1:]
+            user = (self.headers.get('Authorization') or '').replace('Bearer token-', '') or 'anonymous'
+            if method == 'GET' and path == ['me']:
+                return self.send_json(200, {'id': f'fakeuser-{user}', 'display_name': user})
+            if method == 'GET' and path == ['me', 'playlists']:
+                owned = [p for p in fake.playlists.values() if p['owner'] == f'fakeuser-{user}']
+                return self.send_json(200, {'items': [{'id': p['id'], 'name': p['name']} for p in owned], 'total': len(owned)})
+            if method == 'GET' and path == ['search']:
+                return self.send_json(200, fake.search(query.get('q', ''), int(query.get('limit', 10)), int(query.get('offset', 0))))
+            if method == 'GET' and path == ['tracks']:
+                ids = [tid for tid in query.get('ids', '').split(',') if tid]
+                return self.send_json(200, {'tracks': [fake.catalog.get(tid) for tid in ids]})
+            if method == 'GET' and len(path) == 2 and path[0] == 'tracks':
+                track = fake.catalog.get(path[1])
+                if track is None:
+                    return self.send_json(404, {'error': {'status': 404, 'message': 'Invalid id'}})
+                return self.send_json(200, track)
+            if method == 'POST' and len(path) == 3 and path[0] == 'users' and path[2] == 'playlists':
+                return self.send_json(201, fake.create_playlist(path[1], body.get('name', 'Playlist')))
+            if len(path) >= 2 and path[0] == 'playlists' and path[1] in fake.playlists:
+                playlist_id = path[1]
+                if method == 'GET' and len(path) == 2:
+                    return self.send_json(200, fake.playlist(playlist_id, query.get('fields')))
+                if path[2:] == ['tracks']:
+                    if method == 'GET':
+                        return self.send_json(200, fake.playlist_items(playlist_id, int(query.get('limit', 100)), int(query.get('offset', 0))))
+                    if method == 'POST':
+                        # spotipy sends the URI list itself as the body.
+                        uris = body if isinstance(body, list) else body.get('uris', [])
+                        return self.send_json(201, fake.add_items(playlist_id, uris))
+                    if method == 'PUT':
+                        return self.send_json(200, fake.reorder_items(
+                            playlist_id, body['range_start'], body['insert_before'], body.get('range_length', 1)
+                        ))
+            return self.send_json(404, {'error': {'status': 404, 'message': 'Not found'}})
+
+        def handle_safely(self, method):
+            try:
+                self.handle_any(method)
+            except Exception as e:
+                self.send_json(500, {'error': {'status': 500, 'message': str(e)}})
+
+        def do_GET(self):
+            self.handle_safely('GET')
+
+        def do_POST(self):
+            self.handle_safely('POST')
+
+        def do_PUT(self):
+            self.handle_safely('PUT')
+
+    return Handler
+
+
+def serve(fake, host='127.0.0.1', port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='fake-spotify', daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--catalog', type=int, default=5000, help='number of tracks in the catalog')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--rate-429', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+
+    fake = FakeSpotify(args.catalog, args.latency_ms, args.jitter_ms, args.rate_429, args.retry_after)
+    server = serve(fake, args.host, args.port)
+    print(f'Fake Spotify listening on http://{args.host}:{server.server_port}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
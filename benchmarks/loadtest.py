@@ -0,0 +1,183 @@
+"""End-to-end load test against a running Drolg server.
+
+One host registers, links Spotify and creates an event. Then --guests
+simulated guests, --concurrency at a time, each do the following: register,
+link Spotify, join the event, search, add a song, read the play queue and
+vote. Latency percentiles are reported per route. Run the app against
+benchmarks/fake_spotify.py so no real Spotify traffic is made:
+
+    python benchmarks/fake_spotify.py --port 8900 --latency-ms 80 &
+    SPOTIFY_API_URL=http://127.0.0.1:8900/v1/ SPOTIFY_ACCOUNTS_URL=http://127.0.0.1:8900 \\
+        gunicorn -c gunicorn.conf.py -w 4 -b 127.0.0.1:8000 wsgi:app &
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8000 --guests 300 --concurrency 50
+
+Spotify writes run as jobs inside the web workers by default in development.
+To load-test the production layout, set JOBS_IN_PROCESS=false and start
+`python worker.py` with the same environment.
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+from fake_spotify import WORDS
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def timed(self, route, call, expect=None):
+        # With expect set, only a 2xx response of that content type counts as
+        # a success and anything else is returned as None. An expired session
+        # answers with a redirect to the login page instead of the data asked for.
+        started = time.perf_counter()
+        try:
+            response = call()
+            ok = response.status_code < 400
+            if expect is not None:
+                ok = response.status_code < 300 and response.headers.get('Content-Type', '').startswith(expect)
+        except requests.RequestException:
+            response, ok = None, False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples[route].append(elapsed)
+            if not ok:
+                self.errors[route] += 1
+        if expect is not None and not ok:
+            return None
+        return response
+
+    def report(self):
+        rows = {}
+        for route, samples in self.samples.items():
+            rows[route] = {
+                'requests': len(samples),
+                'errors': self.errors[route],
+                'p50_ms': round(percentile(samples, 50) * 1000, 1),
+                'p95_ms': round(percentile(samples, 95) * 1000, 1),
+                'p99_ms': round(percentile(samples, 99) * 1000, 1),
+                'mean_ms': round(statistics.mean(samples) * 1000, 1)
+            }
+        return rows
+
+
+def register(session, base_url, username):
+    return session.post(f'{base_url}/register', data={
+        'username': username,
+        'email': f'{username}@example.com',
+        'password': 'loadtest-password',
+        'confirm_password': 'loadtest-password'
+    }, allow_redirects=False)
+
+
+def link_spotify(session, base_url, username):
+    # The fake accounts service accepts any code, so the authorize redirect is skipped.
+    return session.get(f'{base_url}/callback', params={'code': username}, allow_redirects=False)
+
+
+def create_event(base_url, run_id):
+    session = requests.Session()
+    host = f'host-{run_id}'
+    register(session, base_url, host).raise_for_status()
+    link_spotify(session, base_url, host).raise_for_status()
+
+    start = datetime.now() + timedelta(hours=1)
+    session.post(f'{base_url}/create_event', data={
+        'title': f'Load test {run_id}',
+        'description': 'Load test event',
+        'date_event': start.strftime('%Y-%m-%dT%H:%M'),
+        'end_time': (start + timedelta(hours=3)).strftime('%Y-%m-%dT%H:%M'),
+        'mood': 'party',
+        'playlist_option': 'new',
+        'new_playlist_name': f'Load test {run_id}'
+    }, allow_redirects=False).raise_for_status()
+
+    event_ids = [int(event_id) for event_id in re.findall(r'/event/(\d+)"', session.get(f'{base_url}/dashboard').text)]
+    if not event_ids:
+        raise SystemExit('Event creation failed; is the app pointed at the fake Spotify server?')
+    event_id = max(event_ids)
+    invite_code = re.search(r'Invite Code:</strong>\s*(\w+)', session.get(f'{base_url}/event/{event_id}').text).group(1)
+    return event_id, invite_code
+
+
+def run_guest(base_url, recorder, run_id, number, event_id, invite_code, votes):
+    session = requests.Session()
+    username = f'guest-{run_id}-{number}'
+    recorder.timed('register', lambda: register(session, base_url, username))
+    recorder.timed('spotify_callback', lambda: link_spotify(session, base_url, username))
+    recorder.timed('join_event', lambda: session.post(
+        f'{base_url}/join_event', data={'invite_code': invite_code}, allow_redirects=False
+    ))
+
+    response = recorder.timed('search_songs', lambda: session.get(
+        f'{base_url}/search_songs', params={'query': random.choice(WORDS), 'event_id': event_id},
+        allow_redirects=False
+    ), expect='text/html')
+    track_ids = re.findall(r'/add_song/\d+/(\w+)"', response.text) if response is not None else []
+    if track_ids:
+        track_id = random.choice(track_ids)
+        recorder.timed('add_song', lambda: session.post(
+            f'{base_url}/add_song/{event_id}/{track_id}', allow_redirects=False
+        ))
+
+    response = recorder.timed('event_queue', lambda: session.get(
+        f'{base_url}/api/event/{event_id}/queue', params={'limit': 50}, allow_redirects=False
+    ), expect='application/json')
+    song_ids = [song['song_id'] for song in response.json()['songs']] if response is not None else []
+    for song_id in random.sample(song_ids, min(votes, len(song_ids))):
+        recorder.timed('vote_song', lambda: session.post(f'{base_url}/vote/{song_id}', allow_redirects=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--guests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--votes', type=int, default=3, help='votes cast by each guest')
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+
+    base_url = args.base_url.rstrip('/')
+    run_id = f'{int(time.time())}{random.randint(100, 999)}'
+    event_id, invite_code = create_event(base_url, run_id)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(run_guest, base_url, recorder, run_id, number, event_id, invite_code, args.votes)
+            for number in range(args.guests)
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    report = recorder.report()
+    print(f'{args.guests} guests, concurrency {args.concurrency}, {elapsed:.1f}s, event {event_id}')
+    print(f"{'route':<18}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, row in report.items():
+        print(f"{route:<18}{row['requests']:>9}{row['errors']:>8}{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'guests': args.guests, 'concurrency': args.concurrency, 'seconds': round(elapsed, 2), 'routes': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""Latency of the hot route handlers at production-like data sizes.
+
+Builds an in-memory SQLite database through create_app() with --events
+events, --users users and --votes votes. The views get an in-process fake
+Spotify client, so no network is involved. Then vote_song, add_song,
+search_songs, event and dashboard are timed through the Flask test client.
+Results are written as JSON so runs from different commits can be compared:
+
+    python benchmarks/routes.py --output before.json
+    python benchmarks/routes.py --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_spotify import FakeSpotify, WORDS, track_id
+
+HOT_EVENT_ID = 1
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class FakeSpotifyClient:
+    """The slice of the spotipy client the views use, answered from memory."""
+
+    def __init__(self, fake):
+        self.fake = fake
+
+    def me(self):
+        return {'id': 'benchmark-host'}
+
+    def playlist(self, playlist_id, fields=None, **kwargs):
+        return self.fake.playlist(playlist_id, fields)
+
+    def playlist_items(self, playlist_id, limit=100, offset=0, **kwargs):
+        return self.fake.playlist_items(playlist_id, limit, offset)
+
+    def search(self, q, limit=10, offset=0, type='track', **kwargs):
+        return self.fake.search(q, limit, offset)
+
+    def track(self, track_id, **kwargs):
+        return self.fake.catalog.get(track_id)
+
+    def tracks(self, tracks, **kwargs):
+        return {'tracks': [self.fake.catalog.get(tid) for tid in tracks]}
+
+    def current_user_playlists(self, **kwargs):
+        return {'items': []}
+
+
+def load_data(conn, fake, args):
+    from website.vote_engine import wilson_score
+
+    rng = random.Random(11)
+    now = datetime(2026, 1, 1, 20, 0)
+    catalog = list(fake.catalog.values())
+
+    conn.executemany(
+        "INSERT INTO user (id, username, email, password_hash) VALUES (?, ?, ?, 'x')",
+        ((i, f'user{i}', f'user{i}@example.com') for i in range(1, args.users + 1))
+    )
+    conn.execute("INSERT INTO mood (id, name) VALUES (1, 'party')")
+
+    # User 1 hosts a slice of events and attends more, so the dashboard has
+    # real rows to render; event 1 is the busy event every route targets.
+    hosts = [1 if i <= args.hosted else rng.randint(2, args.users) for i in range(1, args.events + 1)]
+    conn.executemany(
+        "INSERT INTO event (id, title, description, date_created, date_event, end_time, duration, "
+        "invite_code, host_id, spotify_playlist_id, mood_id) VALUES (?, ?, 'Benchmark event', ?, ?, ?, ?, ?, ?, ?, 1)",
+        (
+            (i, f'Event {i}', now, now, now + timedelta(hours=3), datetime(1970, 1, 1, 3, 0),
+             f'INV{i:08d}', hosts[i - 1], f'fakeplaylist{i:010d}')
+            for i in range(1, args.events + 1)
+        )
+    )
+    conn.executemany("INSERT INTO playlist (id, name, event_id) VALUES (?, ?, ?)",
+                     ((i, f'Event {i}', i) for i in range(1, args.events + 1)))
+
+    attendees = {HOT_EVENT_ID: list(range(2, args.hot_attendees + 2))}
+    for event_id in range(2, args.events + 1):
+        attendees[event_id] = rng.sample(range(2, args.users + 1), args.attendees)
+    for event_id in rng.sample(range(args.hosted + 1, args.events + 1), args.attended):
+        if 1 not in attendees[event_id]:
+            attendees[event_id].append(1)
+    conn.executemany("INSERT INTO user_event (user_id, event_id) VALUES (?, ?)",
+                     ((user_id, event_id) for event_id, users in attendees.items() for user_id in users))
+
+    songs = {}
+    rows = []
+    song_id = 0
+    for event_id in range(1, args.events + 1):
+        count = args.hot_songs if event_id == HOT_EVENT_ID else args.songs
+        songs[event_id] = []
+        for track in rng.sample(catalog, count):
+            song_id += 1
+            songs[event_id].append(song_id)
+            rows.append((song_id, track['name'], track['artists'][0]['name'], track['id'], event_id))
+    conn.executemany(
+        "INSERT INTO song (id, title, artist, spotify_track_id, playlist_id, mood_id) VALUES (?, ?, ?, ?, ?, 1)", rows
+    )
+    fake.playlists[f'fakeplaylist{HOT_EVENT_ID:010d}'] = {
+        'id': f'fakeplaylist{HOT_EVENT_ID:010d}', 'name': 'Event 1', 'owner': 'benchmark-host',
+        'items': [row[3] for row in rows[:args.hot_songs]], 'version': 0
+    }
+
+    def votes():
+        # Half the votes land on the busy event, the rest spread over the others.
+        emitted = 0
+        hot_budget = args.votes // 2
+        for user_id in attendees[HOT_EVENT_ID]:
+            for song in songs[HOT_EVENT_ID]:
+                if emitted >= hot_budget:
+                    break
+                if rng.random() < 0.6:
+                    emitted += 1
+                    yield (user_id, song, HOT_EVENT_ID)
+        for event_id in range(2, args.events + 1):
+            for user_id in attendees[event_id]:
+                for song in songs[event_id]:
+                    if emitted >= args.votes:
+                        return
+                    emitted += 1
+                    yield (user_id, song, event_id)
+
+    batch = []
+    for vote in votes():
+        batch.append(vote)
+        if len(batch) == 50000:
+            conn.executemany("INSERT INTO vote (user_id, song_id, event_id) VALUES (?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT INTO vote (user_id, song_id, event_id) VALUES (?, ?, ?)", batch)
+    conn.execute("UPDATE song SET vote_count = (SELECT COUNT(*) FROM vote WHERE vote.song_id = song.id)")
+    conn.executemany("UPDATE song SET score = ? WHERE id = ?", (
+        (wilson_score(vote_count, 0), song_id)
+        for song_id, vote_count in conn.execute("SELECT id, vote_count FROM song WHERE vote_count > 0").fetchall()
+    ))
+    conn.commit()
+    return songs, attendees
+
+
+def logged_in_client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+        session['user_id'] = user_id
+    return client
+
+
+def time_route(samples, call):
+    started = time.perf_counter()
+    response = call()
+    response.get_data()
+    response.close()
+    samples.append(time.perf_counter() - started)
+    if response.status_code >= 400:
+        raise SystemExit(f'benchmark request failed with {response.status_code}')
+
+
+def summarize(samples):
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3)
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--votes', type=int, default=1000000)
+    parser.add_argument('--songs', type=int, default=20, help='songs per event')
+    parser.add_argument('--attendees', type=int, default=10, help='attendees per event')
+    parser.add_argument('--hot-songs', type=int, default=500, help='songs in the busy event')
+    parser.add_argument('--hot-attendees', type=int, default=500, help='attendees of the busy event')
+    parser.add_argument('--hosted', type=int, default=20, help='events hosted by the dashboard user')
+    parser.add_argument('--attended', type=int, default=50, help='events attended by the dashboard user')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='JSON results path (default benchmarks/results/routes-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results to print p50/p95 changes against')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    # Keep the background writers idle; they would otherwise call Spotify.
+    os.environ['JOBS_IN_PROCESS'] = 'false'
+    os.environ['PLAYLIST_SYNC_DEBOUNCE'] = '86400'
+    os.environ.pop('REDIS_URL', None)
+
+    from website import create_app, db
+    import website.views as views
+
+    app = create_app()
+    app.logger.setLevel('ERROR')
+    fake = FakeSpotify(catalog_size=max(5000, args.hot_songs, args.songs))
+    views.get_spotify_client = lambda: FakeSpotifyClient(fake)
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        conn = db.engine.raw_connection()
+        songs, attendees = load_data(conn, fake, args)
+        conn.close()
+        print(f'loaded {args.events} events, {args.users} users, {args.votes} votes in {time.perf_counter() - started:.1f}s')
+
+    rng = random.Random(5)
+    guests = [logged_in_client(app, user_id) for user_id in attendees[HOT_EVENT_ID][:50]]
+    host = logged_in_client(app, 1)
+    hot_songs = songs[HOT_EVENT_ID]
+    catalog_ids = [track_id(n) for n in range(len(fake.catalog))]
+
+    routes = {
+        'vote_song': lambda: rng.choice(guests).post(f'/vote/{rng.choice(hot_songs)}'),
+        'add_song': lambda: rng.choice(guests).post(f'/add_song/{HOT_EVENT_ID}/{rng.choice(catalog_ids)}'),
+        'search_songs': lambda: rng.choice(guests).get(
+            '/search_songs', query_string={'query': f'{rng.choice(WORDS)} {rng.choice(WORDS)}', 'event_id': HOT_EVENT_ID}
+        ),
+        'event': lambda: rng.choice(guests).get(f'/event/{HOT_EVENT_ID}'),
+        'dashboard': lambda: host.get('/dashboard')
+    }
+
+    results = {}
+    for name, call in routes.items():
+        for _ in range(min(10, args.iterations)):
+            call().close()
+        samples = []
+        for _ in range(args.iterations):
+            time_route(samples, call)
+        results[name] = summarize(samples)
+        print(f"{name:<14} p50={results[name]['p50_ms']:8.3f}ms  p95={results[name]['p95_ms']:8.3f}ms  "
+              f"p99={results[name]['p99_ms']:8.3f}ms")
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'sizes': {key: getattr(args, key) for key in (
+            'events', 'users', 'votes', 'songs', 'attendees', 'hot_songs', 'hot_attendees', 'iterations'
+        )},
+        'routes': results
+    }
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', f'routes-{commit or "local"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'wrote {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {baseline.get('commit') or args.compare}:")
+        for name, row in results.items():
+            before = baseline['routes'].get(name)
+            if before:
+                changes = '  '.join(
+                    f"{key[:-3]} {(row[key] - before[key]) / before[key] * 100:+6.1f}%"
+                    for key in ('p50_ms', 'p95_ms') if before[key]
+                )
+                print(f'{name:<14} {changes}')
+
+
+if __name__ == '__main__':
+    main()
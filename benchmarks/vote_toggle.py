@@ -0,0 +1,97 @@
+"""Vote toggle latency with a large vote table.
+
+Loads --votes rows into a throwaway SQLite database created from the models,
+then times the vote_song toggle (lookup by user and song, insert or delete,
+commit) against the indexed vote table and an unindexed copy of it.
+
+    python benchmarks/vote_toggle.py --votes 1000000 --toggles 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def load_votes(conn, table, votes, songs_per_user, batch=50000):
+    rows = ((i + 1, i // songs_per_user + 1, i % songs_per_user + 1, 1) for i in range(votes))
+    while True:
+        chunk = [row for _, row in zip(range(batch), rows)]
+        if not chunk:
+            break
+        conn.executemany(f"INSERT INTO {table} (id, user_id, song_id, event_id) VALUES (?, ?, ?, ?)", chunk)
+    conn.commit()
+
+
+def time_toggles(conn, table, toggles, users, songs_per_user):
+    samples = []
+    for _ in range(toggles):
+        user_id = random.randint(1, users + 10)
+        song_id = random.randint(1, songs_per_user)
+        started = time.perf_counter()
+        row = conn.execute(f"SELECT id FROM {table} WHERE user_id = ? AND song_id = ?", (user_id, song_id)).fetchone()
+        if row:
+            conn.execute(f"DELETE FROM {table} WHERE id = ?", (row[0],))
+        else:
+            conn.execute(f"INSERT INTO {table} (user_id, song_id, event_id) VALUES (?, ?, 1)", (user_id, song_id))
+        conn.commit()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<12} p50={percentile(samples, 50):8.3f}ms  p95={percentile(samples, 95):8.3f}ms  "
+          f"p99={percentile(samples, 99):8.3f}ms  mean={statistics.mean(samples):8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--votes', type=int, default=1000000)
+    parser.add_argument('--toggles', type=int, default=500)
+    parser.add_argument('--songs-per-user', type=int, default=1000)
+    parser.add_argument('--skip-unindexed', action='store_true')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='drolg-bench-'), 'votes.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+
+    from website import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    import sqlite3
+    conn = sqlite3.connect(path)
+    users = args.votes // args.songs_per_user
+
+    started = time.perf_counter()
+    load_votes(conn, 'vote', args.votes, args.songs_per_user)
+    print(f"loaded {args.votes} votes in {time.perf_counter() - started:.1f}s")
+
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM vote WHERE user_id = ? AND song_id = ?", (1, 1)).fetchall()
+    print('plan:', '; '.join(row[-1] for row in plan))
+    report('indexed', time_toggles(conn, 'vote', args.toggles, users, args.songs_per_user))
+
+    if not args.skip_unindexed:
+        conn.execute("CREATE TABLE vote_unindexed AS SELECT * FROM vote")
+        conn.commit()
+        report('unindexed', time_toggles(conn, 'vote_unindexed', max(args.toggles // 10, 10), users, args.songs_per_user))
+
+    conn.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,58 @@ class Config:
     SPOTIPY_CLIENT_ID = os.environ.get('SPOTIPY_CLIENT_ID')
     SPOTIPY_CLIENT_SECRET = os.environ.get('SPOTIPY_CLIENT_SECRET')
     SPOTIPY_REDIRECT_URI = os.environ.get('SPOTIPY_REDIRECT_URI')
+    # Overridable so load tests can run against benchmarks/fake_spotify.py.
+    SPOTIFY_API_URL = os.environ.get('SPOTIFY_API_URL', 'https://api.spotify.com/v1/')
+    SPOTIFY_ACCOUNTS_URL = os.environ.get('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com')
+    REDIS_URL = os.environ.get('REDIS_URL')
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 0.5))
+    PLAYLIST_CACHE_TTL = int(os.environ.get('PLAYLIST_CACHE_TTL', 3600))
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 600))
+    LOCAL_SEARCH_MIN_RESULTS = int(os.environ.get('LOCAL_SEARCH_MIN_RESULTS', 5))
+    PLAYLIST_WARM_INTERVAL = float(os.environ.get('PLAYLIST_WARM_INTERVAL', 30))
+    PLAYLIST_SYNC_DEBOUNCE = float(os.environ.get('PLAYLIST_SYNC_DEBOUNCE', 10))
+    VOTE_FLUSH_INTERVAL = float(os.environ.get('VOTE_FLUSH_INTERVAL', 1))
+    VOTE_FLUSH_BATCH = int(os.environ.get('VOTE_FLUSH_BATCH', 500))
+    VOTE_FLUSH_MAX_ATTEMPTS = int(os.environ.get('VOTE_FLUSH_MAX_ATTEMPTS', 5))
+    VOTE_HYDRATE_TTL = int(os.environ.get('VOTE_HYDRATE_TTL', 300))
+    VOTE_BATCH_MAX = int(os.environ.get('VOTE_BATCH_MAX', 50))
+    PLAY_QUEUE_PAGE_SIZE = int(os.environ.get('PLAY_QUEUE_PAGE_SIZE', 10))
+    SSE_HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_INTERVAL', 15))
+    SSE_STREAM_TIMEOUT = float(os.environ.get('SSE_STREAM_TIMEOUT', 300))
+    QUERY_STATS_ENABLED = os.environ.get('QUERY_STATS_ENABLED', 'true').lower() == 'true'
+    QUERY_COUNT_WARN_THRESHOLD = int(os.environ.get('QUERY_COUNT_WARN_THRESHOLD', 20))
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    SLOW_QUERY_LOG_COUNT = int(os.environ.get('SLOW_QUERY_LOG_COUNT', 3))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SESSION_CLEANUP_INTERVAL = float(os.environ.get('SESSION_CLEANUP_INTERVAL', 3600))
+    SESSION_DB_POOL_SIZE = int(os.environ.get('SESSION_DB_POOL_SIZE', 5))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+    TOKEN_REFRESH_AHEAD = int(os.environ.get('TOKEN_REFRESH_AHEAD', 300))
+    TOKEN_MIN_VALIDITY = int(os.environ.get('TOKEN_MIN_VALIDITY', 30))
+    TOKEN_REFRESH_INTERVAL = float(os.environ.get('TOKEN_REFRESH_INTERVAL', 30))
+    TOKEN_ACTIVE_WINDOW = int(os.environ.get('TOKEN_ACTIVE_WINDOW', 3600))
+    JOBS_IN_PROCESS = os.environ.get('JOBS_IN_PROCESS', 'false').lower() == 'true'
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 4))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    JOB_BACKOFF_BASE = float(os.environ.get('JOB_BACKOFF_BASE', 2))
+    JOB_BACKOFF_MAX = float(os.environ.get('JOB_BACKOFF_MAX', 300))
+    JOB_LEASE = int(os.environ.get('JOB_LEASE', 120))
+    JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 7 * 24 * 3600))
+    SPOTIFY_PAGE_WORKERS = int(os.environ.get('SPOTIFY_PAGE_WORKERS', 4))
+    SPOTIFY_POOL_CONNECTIONS = int(os.environ.get('SPOTIFY_POOL_CONNECTIONS', 4))
+    SPOTIFY_POOL_SIZE = int(os.environ.get('SPOTIFY_POOL_SIZE', 10))
+    SPOTIFY_CONNECT_TIMEOUT = float(os.environ.get('SPOTIFY_CONNECT_TIMEOUT', 3.05))
+    SPOTIFY_READ_TIMEOUT = float(os.environ.get('SPOTIFY_READ_TIMEOUT', 10))
+    SPOTIFY_RATE_LIMIT = float(os.environ.get('SPOTIFY_RATE_LIMIT', 10))
+    SPOTIFY_RATE_BURST = int(os.environ.get('SPOTIFY_RATE_BURST', 20))
+    SPOTIFY_MAX_QUEUE_WAIT = float(os.environ.get('SPOTIFY_MAX_QUEUE_WAIT', 10))
+    SPOTIFY_429_RETRIES = int(os.environ.get('SPOTIFY_429_RETRIES', 3))
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    # No separate worker process in development unless asked for.
+    JOBS_IN_PROCESS = os.environ.get('JOBS_IN_PROCESS', 'true').lower() == 'true'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///party_playlist.db'
 
 class ProductionConfig(Config):
@@ -0,0 +1,20 @@
+import os
+
+# Event pages keep a Server-Sent Events stream open for up to
+# SSE_STREAM_TIMEOUT, and a streaming response holds whatever serves it for
+# the whole stream. Under gevent each request is a greenlet, so an open
+# stream costs a socket rather than one of a handful of threads, and each
+# worker serves up to worker_connections requests and streams at once.
+worker_class = 'gevent'
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+
+def post_fork(server, worker):
+    # psycopg2 blocks the whole worker on a query unless it yields to the
+    # gevent hub while waiting on the database.
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        return
+    patch_psycopg()
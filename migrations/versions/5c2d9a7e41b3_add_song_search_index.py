@@ -0,0 +1,55 @@
+"""Add song search index
+
+Revision ID: 5c2d9a7e41b3
+Revises: 3b5af10cc3b6
+Create Date: 2026-10-18 10:12:04.118203
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2d9a7e41b3'
+down_revision = '3b5af10cc3b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS song_fts USING fts5("
+            "title, artist, content='song', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS song_fts_ai AFTER INSERT ON song BEGIN "
+            "INSERT INTO song_fts(rowid, title, artist) VALUES (new.id, new.title, new.artist); END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS song_fts_ad AFTER DELETE ON song BEGIN "
+            "INSERT INTO song_fts(song_fts, rowid, title, artist) VALUES ('delete', old.id, old.title, old.artist); END"
+        )
+        op.execute(
+            "CREATE TRIGGER IF NOT EXISTS song_fts_au AFTER UPDATE OF title, artist ON song BEGIN "
+            "INSERT INTO song_fts(song_fts, rowid, title, artist) VALUES ('delete', old.id, old.title, old.artist); "
+            "INSERT INTO song_fts(rowid, title, artist) VALUES (new.id, new.title, new.artist); END"
+        )
+        op.execute("INSERT INTO song_fts(song_fts) VALUES ('rebuild')")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_song_title_trgm ON song USING gin (title gin_trgm_ops)")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_song_artist_trgm ON song USING gin (artist gin_trgm_ops)")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS song_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS song_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS song_fts_ai")
+        op.execute("DROP TABLE IF EXISTS song_fts")
+    elif bind.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_song_artist_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_song_title_trgm")
@@ -0,0 +1,32 @@
+"""Add denormalized vote_count to Song
+
+Revision ID: 7e0c5f3a9b18
+Revises: d4e7b1a9c352
+Create Date: 2026-10-18 12:30:55.217640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e0c5f3a9b18'
+down_revision = 'd4e7b1a9c352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('vote_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute("UPDATE song SET vote_count = (SELECT COUNT(*) FROM vote WHERE vote.song_id = song.id)")
+
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.create_index('ix_song_playlist_id_vote_count', ['playlist_id', 'vote_count'], unique=False)
+
+
+def downgrade():
+    # Not in batch mode: recreating song on SQLite would drop the song_fts triggers.
+    op.drop_index('ix_song_playlist_id_vote_count', table_name='song')
+    op.drop_column('song', 'vote_count')
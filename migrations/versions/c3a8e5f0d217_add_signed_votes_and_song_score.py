@@ -0,0 +1,66 @@
+"""Add signed votes, downvote counts and song score
+
+Revision ID: c3a8e5f0d217
+Revises: b6f1d2c8e473
+Create Date: 2026-10-18 16:40:21.774903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import math
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8e5f0d217'
+down_revision = 'b6f1d2c8e473'
+branch_labels = None
+depends_on = None
+
+
+def lower_bound(k, n, z=1.959964):
+    p = k / n
+    return (p + z * z / (2 * n) - z * math.sqrt((p * (1 - p) + z * z / (4 * n)) / n)) / (1 + z * z / n)
+
+
+def wilson_score(upvotes, downvotes):
+    # Copied from website.vote_engine so the migration does not depend on
+    # application code that may change later.
+    n = upvotes + downvotes
+    if n == 0:
+        return 0.0
+    return float('%.12f' % (lower_bound(upvotes, n) - lower_bound(downvotes, n)))
+
+
+def upgrade():
+    # Existing votes are all upvotes.
+    with op.batch_alter_table('vote', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('value', sa.SmallInteger(), server_default='1', nullable=False))
+
+    # Only columns and indexes are added to song, which SQLite does in place;
+    # recreating the table would drop the song_fts triggers.
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('downvotes', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('score', sa.Float(), server_default='0', nullable=False))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, vote_count FROM song WHERE vote_count > 0")).fetchall()
+    if rows:
+        conn.execute(
+            sa.text("UPDATE song SET score = :score WHERE id = :id"),
+            [{'id': song_id, 'score': wilson_score(vote_count, 0)} for song_id, vote_count in rows]
+        )
+
+    op.create_index('ix_song_playlist_id_score', 'song', ['playlist_id', 'score'], unique=False)
+    op.drop_index('ix_song_playlist_id_vote_count', table_name='song')
+
+
+def downgrade():
+    # Not in batch mode: recreating song on SQLite would drop the song_fts triggers.
+    op.create_index('ix_song_playlist_id_vote_count', 'song', ['playlist_id', 'vote_count'], unique=False)
+    op.drop_index('ix_song_playlist_id_score', table_name='song')
+    op.drop_column('song', 'score')
+    op.drop_column('song', 'downvotes')
+
+    op.execute("DELETE FROM vote WHERE value < 0")
+    with op.batch_alter_table('vote', schema=None) as batch_op:
+        batch_op.drop_column('value')
@@ -0,0 +1,59 @@
+"""Add indexes and unique vote constraint for voting
+
+Revision ID: d4e7b1a9c352
+Revises: a81f3c6d2e90
+Create Date: 2026-10-18 11:48:21.904417
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e7b1a9c352'
+down_revision = 'a81f3c6d2e90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Toggling used to race, so drop duplicate votes before enforcing uniqueness.
+    op.execute(
+        "DELETE FROM vote WHERE id NOT IN "
+        "(SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM vote GROUP BY user_id, song_id) AS keep)"
+    )
+
+    with op.batch_alter_table('vote', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_vote_user_song', ['user_id', 'song_id'])
+        batch_op.create_index('ix_vote_song_id', ['song_id'], unique=False)
+        batch_op.create_index('ix_vote_event_id_song_id', ['event_id', 'song_id'], unique=False)
+
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_song_playlist_id'), ['playlist_id'], unique=False)
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_event_host_id'), ['host_id'], unique=False)
+
+    with op.batch_alter_table('playlist', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_playlist_event_id'), ['event_id'], unique=False)
+
+    with op.batch_alter_table('user_event', schema=None) as batch_op:
+        batch_op.create_index('ix_user_event_event_id', ['event_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_event_event_id')
+
+    with op.batch_alter_table('playlist', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_playlist_event_id'))
+
+    with op.batch_alter_table('event', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_event_host_id'))
+
+    with op.batch_alter_table('song', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_song_playlist_id'))
+
+    with op.batch_alter_table('vote', schema=None) as batch_op:
+        batch_op.drop_index('ix_vote_event_id_song_id')
+        batch_op.drop_index('ix_vote_song_id')
+        batch_op.drop_constraint('uq_vote_user_song', type_='unique')
@@ -0,0 +1,93 @@
+import os
+
+# config.py reads the environment at import time.
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+from datetime import datetime, timedelta
+from config import DevelopmentConfig
+from website import create_app, db
+from website.background import stop_background_threads
+from website.models import User, Mood, Event, Playlist, Song
+from werkzeug.security import generate_password_hash
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(DevelopmentConfig, 'TESTING', True, raising=False)
+    monkeypatch.setattr(DevelopmentConfig, 'SECRET_KEY', 'test')
+    monkeypatch.setattr(DevelopmentConfig, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(DevelopmentConfig, 'REDIS_URL', None)
+    monkeypatch.setattr(DevelopmentConfig, 'JOBS_IN_PROCESS', False)
+    monkeypatch.setattr(DevelopmentConfig, 'QUERY_STATS_ENABLED', False)
+    app = create_app()
+
+    # In-process caches outlive the app; each test gets a fresh database.
+    from website.user_cache import _users
+    from website.playlist_cache import _playlists
+    from website.search_cache import _searches
+    from website.playlist_jobs import _reorders
+    for cache in (_users, _playlists, _searches):
+        cache.local.clear()
+    _reorders.clear()
+
+    with app.app_context():
+        db.create_all()
+        seed()
+    yield app
+    stop_background_threads()
+    with app.app_context():
+        db.engine.dispose()
+    if 'drolg_session_engine' in app.extensions:
+        app.extensions['drolg_session_engine'].dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def fake_redis(app, monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis', reason='install requirements-dev.txt to run the redis tests')
+    client = fakeredis.FakeRedis(decode_responses=True)
+    import sys
+    for name, module in list(sys.modules.items()):
+        if name.startswith('website') and hasattr(module, 'get_redis'):
+            monkeypatch.setattr(module, 'get_redis', lambda app=None: client)
+    return client
+
+
+def seed():
+    host = User(username='host', email='host@example.com', password_hash=generate_password_hash('secret', 'pbkdf2:sha256:1000'),
+                spotify_id='host-spotify', spotify_token='token', refresh_token='refresh', token_expiry=2 ** 31)
+    guest = User(username='guest', email='guest@example.com', password_hash=generate_password_hash('secret', 'pbkdf2:sha256:1000'),
+                 spotify_id='guest-spotify')
+    mood = Mood(name='chill')
+    db.session.add_all([host, guest, mood])
+    db.session.commit()
+
+    now = datetime.now()
+    event = Event(title='party', description='test', date_event=now, end_time=now + timedelta(hours=2),
+                  duration=timedelta(hours=2), invite_code='INVITE', host_id=host.id,
+                  spotify_playlist_id='playlist', mood_id=mood.id)
+    event.attendees.append(guest)
+    db.session.add(event)
+    db.session.commit()
+
+    playlist = Playlist(name='party', event_id=event.id)
+    db.session.add(playlist)
+    db.session.commit()
+    db.session.add_all([
+        Song(title=f'song {i}', artist='artist', spotify_track_id=f'track{i}', playlist_id=playlist.id, mood_id=mood.id)
+        for i in range(5)
+    ])
+    db.session.commit()
+
+
+@pytest.fixture
+def login(client):
+    def login(username='guest', password='secret'):
+        return client.post('/login', data={'username': username, 'password': password})
+    return login
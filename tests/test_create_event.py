@@ -0,0 +1,40 @@
+from spotipy.exceptions import SpotifyException
+from website import db
+from website.models import Event
+import website.views as views
+
+
+class FakeSpotify:
+    def playlist(self, playlist_id, fields=None):
+        if playlist_id != 'good':
+            raise SpotifyException(404, -1, 'Not found.')
+        return {'id': 'good'}
+
+
+def create(client, playlist_id):
+    return client.post('/create_event', data={
+        'title': 'new party', 'description': 'test', 'mood': 'chill',
+        'date_event': '2030-01-01T20:00', 'end_time': '2030-01-01T23:00',
+        'playlist_option': 'existing', 'existing_playlist_id': playlist_id,
+    })
+
+
+def new_events(app):
+    with app.app_context():
+        return db.session.execute(db.select(Event).where(Event.title == 'new party')).scalars().all()
+
+
+def test_unknown_existing_playlist_is_rejected(app, client, login, monkeypatch):
+    monkeypatch.setattr(views, 'get_spotify_client', lambda: FakeSpotify())
+    login('host')
+    response = create(client, 'missing')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/create_event')
+    assert new_events(app) == []
+
+
+def test_existing_playlist_is_checked_and_stored(app, client, login, monkeypatch):
+    monkeypatch.setattr(views, 'get_spotify_client', lambda: FakeSpotify())
+    login('host')
+    create(client, 'good')
+    assert [event.spotify_playlist_id for event in new_events(app)] == ['good']
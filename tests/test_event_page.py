@@ -0,0 +1,50 @@
+from spotipy.exceptions import SpotifyException
+import website.views as views
+
+
+def test_event_page_flashes_are_shown_once(client, login):
+    login()
+    client.get('/dashboard')
+    with client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Song added to the playlist!')]
+
+    page = client.get('/event/1').get_data(as_text=True)
+    assert 'Song added to the playlist!' in page
+
+    page = client.get('/dashboard').get_data(as_text=True)
+    assert 'Song added to the playlist!' not in page
+    assert 'alert-' not in page
+
+
+class FailingSpotify:
+    def __init__(self, fail_first=True):
+        self.fail_first = fail_first
+
+    def playlist(self, playlist_id, fields=None):
+        if self.fail_first:
+            raise SpotifyException(502, -1, 'Bad gateway')
+        if fields == 'snapshot_id':
+            return {'snapshot_id': 'snap'}
+        items = [{'track': {'id': f'track{i}', 'name': f'song {i}', 'artists': [{'name': 'artist'}]}} for i in range(2)]
+        return {'snapshot_id': 'snap', 'tracks': {'items': items, 'limit': 2, 'total': 6}}
+
+    def playlist_items(self, playlist_id, limit, offset):
+        raise SpotifyException(502, -1, 'Bad gateway')
+
+
+def test_spotify_error_before_streaming_is_flashed(client, login, monkeypatch):
+    login()
+    monkeypatch.setattr(views, 'get_spotify_client', lambda: FailingSpotify())
+    response = client.get('/event/1')
+    page = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert 'Unable to fetch playlist tracks' in page
+    assert page.rstrip().endswith('</html>')
+
+
+def test_spotify_error_on_a_later_page_ends_the_list(client, login, monkeypatch):
+    login()
+    monkeypatch.setattr(views, 'get_spotify_client', lambda: FailingSpotify(fail_first=False))
+    page = client.get('/event/1').get_data(as_text=True)
+    assert 'song 0' in page and 'song 1' in page
+    assert page.rstrip().endswith('</html>')
@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+from website import db
+from website.jobs import enqueue, job_handler, run_due_jobs, run_next_job, _claim
+from website.models import Job
+import pytest
+
+ran = []
+
+
+@job_handler('test.record')
+def record(value):
+    ran.append(('record', value))
+
+
+@job_handler('test.batch', batch=3)
+def record_batch(payloads):
+    ran.append(('batch', [payload['value'] for payload in payloads]))
+
+
+@job_handler('test.flaky')
+def flaky(value):
+    if value != 'fixed':
+        raise RuntimeError('Spotify is down')
+    ran.append(('flaky', value))
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    ran.clear()
+
+
+def job(job_id):
+    return db.session.get(Job, job_id, populate_existing=True)
+
+
+def make_due(job_id):
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(run_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.session.commit()
+
+
+def test_enqueueing_the_same_key_twice_is_a_no_op(app):
+    with app.app_context():
+        first = enqueue('test.record', {'value': 1}, key='once')
+        db.session.commit()
+        assert enqueue('test.record', {'value': 2}, key='once').id == first.id
+        db.session.commit()
+        assert run_due_jobs(app) == 1
+        assert ran == [('record', 1)]
+
+
+def test_a_queue_runs_one_job_at_a_time_in_order(app):
+    with app.app_context():
+        ids = [enqueue('test.record', {'value': n}, queue='event:1').id for n in range(2)]
+        enqueue('test.record', {'value': 'other'}, queue='event:2')
+        db.session.commit()
+
+        claimed = _claim(app)
+        assert [claimed_job.id for claimed_job in claimed] == [ids[0]]
+        # The second job waits for the first; another queue does not.
+        assert [claimed_job.queue_key for claimed_job in _claim(app)] == ['event:2']
+        assert _claim(app) == []
+        assert job(ids[1]).status == 'queued'
+
+
+def test_failed_job_is_retried_with_backoff_then_gives_up(app):
+    with app.app_context():
+        job_id = enqueue('test.flaky', {'value': 'broken'}, max_attempts=2).id
+        db.session.commit()
+
+        assert run_next_job(app) == 1
+        retry = job(job_id)
+        assert (retry.status, retry.attempts, retry.last_error) == ('queued', 1, 'Spotify is down')
+        assert retry.run_at > datetime.utcnow()
+        assert run_next_job(app) == 0
+
+        make_due(job_id)
+        assert run_next_job(app) == 1
+        assert (job(job_id).status, job(job_id).attempts) == ('failed', 2)
+
+
+def test_retried_job_succeeds_once_the_cause_is_gone(app):
+    with app.app_context():
+        job_id = enqueue('test.flaky', {'value': 'broken'}).id
+        db.session.commit()
+        run_next_job(app)
+
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(payload='{"value": "fixed"}'))
+        make_due(job_id)
+        assert run_next_job(app) == 1
+        assert job(job_id).status == 'done'
+        assert ran == [('flaky', 'fixed')]
+
+
+def test_retried_job_holds_its_place_in_the_queue(app):
+    with app.app_context():
+        failing = enqueue('test.flaky', {'value': 'broken'}, queue='event:1').id
+        enqueue('test.record', {'value': 'after'}, queue='event:1')
+        db.session.commit()
+        run_next_job(app)
+        assert job(failing).status == 'queued'
+        assert run_due_jobs(app) == 0
+        assert ran == []
+
+
+def test_batch_handler_takes_the_run_of_same_named_jobs(app):
+    with app.app_context():
+        for name, value in [('test.batch', 1), ('test.batch', 2), ('test.record', 3), ('test.batch', 4)]:
+            enqueue(name, {'value': value}, queue='event:1')
+        db.session.commit()
+        assert run_due_jobs(app) == 4
+        assert ran == [('batch', [1, 2]), ('record', 3), ('batch', [4])]
+
+
+def test_job_of_a_dead_worker_is_requeued_after_its_lease(app):
+    with app.app_context():
+        job_id = enqueue('test.record', {'value': 1}).id
+        db.session.commit()
+        _claim(app)
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(locked_until=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+        run_due_jobs(app)
+        released = job(job_id)
+        assert (released.status, released.last_error) == ('queued', 'Worker lease expired')
+        make_due(job_id)
+        assert run_due_jobs(app) == 1
+        assert ran == [('record', 1)]
@@ -0,0 +1,51 @@
+from website.playlist_sync import longest_increasing_subsequence, plan_reorder
+import random
+import pytest
+
+
+def apply(items, moves):
+    items = list(items)
+    for range_start, insert_before in moves:
+        item = items.pop(range_start)
+        items.insert(insert_before - (insert_before > range_start), item)
+    return items
+
+
+def test_longest_increasing_subsequence():
+    values = [3, 1, 4, 1, 5, 9, 2, 6]
+    indexes = longest_increasing_subsequence(values)
+    assert len(indexes) == 4
+    assert all(values[a] < values[b] for a, b in zip(indexes, indexes[1:]))
+    assert longest_increasing_subsequence([]) == []
+
+
+def test_sorted_playlist_needs_no_moves():
+    assert plan_reorder(['a', 'b', 'c'], ['a', 'b', 'c']) == []
+
+
+def test_one_track_moved_to_the_top_is_one_move():
+    current = ['a', 'b', 'c', 'd']
+    target = ['d', 'a', 'b', 'c']
+    moves = plan_reorder(current, target)
+    assert len(moves) == 1
+    assert apply(current, moves) == target
+
+
+def test_duplicates_and_local_files_keep_their_slots():
+    current = ['a', None, 'b', 'a', None]
+    target = ['a', 'a', 'b', None, None]
+    assert apply(current, plan_reorder(current, target)) == target
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_moves_reach_the_target_in_the_fewest_single_moves(seed):
+    rng = random.Random(seed)
+    current = [f'track{i}' for i in range(rng.randint(1, 60))]
+    target = current[:]
+    rng.shuffle(target)
+    moves = plan_reorder(current, target)
+    assert apply(current, moves) == target
+
+    positions = {item: i for i, item in enumerate(target)}
+    settled = len(longest_increasing_subsequence([positions[item] for item in current]))
+    assert len(moves) == len(current) - settled
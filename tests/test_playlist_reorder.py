@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+from website import db
+from website.jobs import run_due_jobs
+from website.models import Job
+from website.playlist_jobs import request_playlist_add
+
+
+class FakeSpotify:
+    def __init__(self, track_ids):
+        self.track_ids = list(track_ids)
+        self.added = []
+
+    def playlist(self, playlist_id, fields=None):
+        return {'snapshot_id': 'snapshot'}
+
+    def playlist_items(self, playlist_id, fields=None, limit=100, offset=0):
+        items = [{'track': {'id': track_id}} for track_id in self.track_ids[offset:offset + limit]]
+        return {'items': items, 'total': len(self.track_ids)}
+
+    def playlist_reorder_items(self, playlist_id, range_start, insert_before, snapshot_id=None):
+        track = self.track_ids.pop(range_start)
+        self.track_ids.insert(insert_before - (insert_before > range_start), track)
+        return {'snapshot_id': 'snapshot'}
+
+    def playlist_add_items(self, playlist_id, uris):
+        self.added.extend(uris)
+
+
+def reorder_jobs():
+    return db.session.execute(db.select(Job).where(Job.name == 'playlist.reorder')).scalars().all()
+
+
+def make_due(job):
+    job.run_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_votes_in_a_window_share_one_queued_reorder(app, client, login):
+    login()
+    for song_id in (3, 4, 3):
+        client.post('/api/event/1/votes', json={'votes': [{'song_id': song_id, 'action': 'up'}]})
+
+    with app.app_context():
+        jobs = reorder_jobs()
+        assert len(jobs) == 1
+        assert jobs[0].queue_key == 'event:1'
+        assert jobs[0].status == 'queued'
+        assert jobs[0].run_at > datetime.utcnow()
+
+
+def test_reorder_waits_for_its_window_without_holding_up_the_queue(app, client, login, monkeypatch):
+    sp = FakeSpotify([f'track{i}' for i in range(5)])
+    monkeypatch.setattr('website.playlist_jobs.get_spotify_client_for_user', lambda user_id: sp)
+    monkeypatch.setattr('website.playlist_sync.get_spotify_client_for_user', lambda user_id: sp)
+    login()
+    client.post('/api/event/1/votes', json={'votes': [{'song_id': 5, 'action': 'up'}]})
+
+    with app.app_context():
+        request_playlist_add(1, 1, 'track0')
+        db.session.commit()
+        assert run_due_jobs(app) == 1
+        assert sp.added == ['spotify:track:track0']
+        assert sp.track_ids == [f'track{i}' for i in range(5)]
+
+        make_due(reorder_jobs()[0])
+        assert run_due_jobs(app) == 1
+        assert reorder_jobs()[0].status == 'done'
+        assert sp.track_ids[0] == 'track4'
+
+
+def test_failed_reorder_is_retried(app, client, login, monkeypatch):
+    monkeypatch.setattr('website.playlist_sync.get_spotify_client_for_user', lambda user_id: None)
+    login()
+    client.post('/api/event/1/votes', json={'votes': [{'song_id': 5, 'action': 'up'}]})
+
+    with app.app_context():
+        make_due(reorder_jobs()[0])
+        assert run_due_jobs(app) == 1
+        job = reorder_jobs()[0]
+        assert job.status == 'queued'
+        assert job.attempts == 1
+        assert 'no usable Spotify token' in job.last_error
@@ -0,0 +1,44 @@
+from website import db
+from website.models import User
+from website.vote_engine import apply_votes, ranked_songs, wilson_score
+import pytest
+
+
+def test_wilson_score_is_signed():
+    assert wilson_score(0, 0) == 0.0
+    assert wilson_score(0, 1) < 0.0
+    assert wilson_score(1, 10) < wilson_score(0, 1) < 0.0 < wilson_score(1, 0)
+    assert wilson_score(40, 2) > wilson_score(3, 0)
+    assert wilson_score(3, 3) == 0.0
+    assert wilson_score(5, 0) == -wilson_score(0, 5)
+
+
+@pytest.fixture(params=['sql', 'redis'])
+def voters(request, app):
+    if request.param == 'redis':
+        request.getfixturevalue('fake_redis')
+    app.config['VOTE_FLUSH_INTERVAL'] = 3600
+    with app.test_request_context():
+        users = [User(username=f'voter{i}', email=f'voter{i}@example.com', password_hash='x') for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+        yield [2] + [user.id for user in users]
+
+
+def test_downvoted_songs_rank_below_unvoted_songs(voters):
+    apply_votes(voters[0], 1, [(1, 'down'), (3, 'up'), (4, 'up')])
+    for user_id in voters[1:4]:
+        apply_votes(user_id, 1, [(4, 'down')])
+
+    # 3: 1 up; 2 and 5: unvoted; 1: 0 up 1 down; 4: 1 up 3 down.
+    ranking = ranked_songs(1, count=None)
+    assert [song_id for song_id, score in ranking] == [3, 2, 5, 1, 4]
+    assert dict(ranking) == {
+        1: wilson_score(0, 1), 2: 0.0, 3: wilson_score(1, 0), 4: wilson_score(1, 3), 5: 0.0
+    }
+
+
+def test_clearing_a_downvote_restores_the_song(voters):
+    apply_votes(voters[0], 1, [(1, 'down')])
+    apply_votes(voters[0], 1, [(1, 'clear')])
+    assert ranked_songs(1, count=None) == [(1, 0.0), (2, 0.0), (3, 0.0), (4, 0.0), (5, 0.0)]
@@ -0,0 +1,69 @@
+from spotipy.exceptions import SpotifyException
+from website.rate_limit import RateLimitExceeded, SpotifyScheduler, TokenBucket
+import pytest
+
+
+def throttled(times, retry_after='0.05'):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= times:
+            raise SpotifyException(429, -1, 'Too many requests', headers={'Retry-After': retry_after})
+        return 'ok'
+    return fn, calls
+
+
+def scheduler(app, **config):
+    app.config.update(config)
+    return SpotifyScheduler(app)
+
+
+def test_bucket_makes_callers_wait_once_the_burst_is_spent():
+    bucket = TokenBucket(rate=1, capacity=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert 0 < bucket.take() <= 1
+
+
+def test_429_pauses_calls_and_retries(app):
+    spotify = scheduler(app)
+    fn, calls = throttled(1)
+    assert spotify.call(fn) == 'ok'
+    assert len(calls) == 2
+    assert spotify.stats()['throttled'] == 1
+
+
+def test_429_is_raised_once_retries_run_out(app):
+    spotify = scheduler(app, SPOTIFY_429_RETRIES=1)
+    fn, calls = throttled(5)
+    with pytest.raises(SpotifyException):
+        spotify.call(fn)
+    assert len(calls) == 2
+
+
+def test_long_retry_after_is_not_waited_out(app):
+    spotify = scheduler(app, SPOTIFY_MAX_QUEUE_WAIT=1)
+    fn, calls = throttled(1, retry_after='30')
+    with pytest.raises(RateLimitExceeded) as e:
+        spotify.call(fn)
+    assert len(calls) == 1
+    assert 29 < e.value.retry_after <= 30
+    assert spotify.stats()['rejected'] == 1
+
+
+def test_429_blocks_every_worker_sharing_redis(app, fake_redis):
+    first = scheduler(app, SPOTIFY_MAX_QUEUE_WAIT=1)
+    second = SpotifyScheduler(app)
+    first.block(30)
+    with pytest.raises(RateLimitExceeded):
+        second.acquire()
+    assert second.stats()['blocked_for_seconds'] > 29
+
+
+def test_workers_share_one_token_bucket_through_redis(app, fake_redis):
+    first = scheduler(app, SPOTIFY_RATE_LIMIT=0.1, SPOTIFY_RATE_BURST=1, SPOTIFY_MAX_QUEUE_WAIT=1)
+    second = SpotifyScheduler(app)
+    first.acquire()
+    with pytest.raises(RateLimitExceeded):
+        second.acquire()
@@ -0,0 +1,76 @@
+from website import db
+from website.models import Track
+from website.search_cache import search_tracks
+import threading
+import time
+import pytest
+
+
+class FakeSpotify:
+    def __init__(self, delay=0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.queries = []
+
+    def search(self, q, type, limit):
+        self.queries.append(q)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('Spotify is down')
+        return {'tracks': {'items': [{'id': 'found', 'name': q, 'artists': [{'name': 'artist'}]}]}}
+
+
+def search_concurrently(app, sp, query, callers=5):
+    results = []
+    errors = []
+
+    def search():
+        with app.app_context():
+            try:
+                results.append(search_tracks(sp, query))
+            except RuntimeError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_equivalent_queries_share_one_cached_search(app):
+    sp = FakeSpotify()
+    with app.app_context():
+        first = search_tracks(sp, 'Daft  Punk')
+        assert search_tracks(sp, ' daft punk ') == first
+        assert sp.queries == ['daft punk']
+        assert db.session.get(Track, 'found').title == 'daft punk'
+
+
+def test_concurrent_searches_make_one_spotify_call(app):
+    sp = FakeSpotify(delay=0.2)
+    results, errors = search_concurrently(app, sp, 'daft punk')
+    assert sp.queries == ['daft punk']
+    assert errors == []
+    assert len(results) == 5 and all(result == results[0] for result in results)
+
+
+def test_failed_search_reaches_every_caller_and_is_not_cached(app):
+    sp = FakeSpotify(delay=0.2, fail=True)
+    results, errors = search_concurrently(app, sp, 'daft punk')
+    assert sp.queries == ['daft punk']
+    assert results == [] and len(errors) == 5
+
+    sp.fail = False
+    with app.app_context():
+        assert search_tracks(sp, 'daft punk')[0]['id'] == 'found'
+    assert len(sp.queries) == 2
+
+
+@pytest.mark.parametrize('query', ['', '   ', None])
+def test_blank_query_does_not_call_spotify(app, query):
+    sp = FakeSpotify()
+    with app.app_context():
+        assert search_tracks(sp, query) == []
+    assert sp.queries == []
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+from config import DevelopmentConfig
+from website import create_app
+import pytest
+
+FORGED_SID = 'A' * 43
+
+
+def session_cookie(client):
+    cookie = client.get_cookie('session')
+    return cookie.value if cookie else None
+
+
+def test_unknown_session_id_is_not_adopted(client, login):
+    client.set_cookie('session', FORGED_SID)
+    login()
+    assert session_cookie(client) not in (None, FORGED_SID)
+
+    attacker = client.application.test_client()
+    attacker.set_cookie('session', FORGED_SID)
+    assert attacker.get('/dashboard').status_code == 302
+
+
+def test_login_rotates_session_id(client, login):
+    client.get('/login')
+    with client.session_transaction() as session:
+        session['seen'] = True
+    before = session_cookie(client)
+    login()
+    after = session_cookie(client)
+    assert after != before
+
+    replay = client.application.test_client()
+    replay.set_cookie('session', before)
+    assert replay.get('/dashboard').status_code == 302
+    assert client.get('/dashboard').status_code == 200
+
+
+def test_logout_rotates_session_id(client, login):
+    login()
+    before = session_cookie(client)
+    client.get('/logout')
+    assert session_cookie(client) != before
+
+    replay = client.application.test_client()
+    replay.set_cookie('session', before)
+    assert replay.get('/dashboard').status_code == 302
+
+
+@pytest.fixture
+def small_pool_app(app, monkeypatch):
+    # Fewer connections than concurrent clients: a request that needs a
+    # second connection for its session would time out waiting for one.
+    monkeypatch.setattr(DevelopmentConfig, 'SQLALCHEMY_DATABASE_URI', app.config['SQLALCHEMY_DATABASE_URI'])
+    monkeypatch.setattr(DevelopmentConfig, 'SQLALCHEMY_ENGINE_OPTIONS',
+                        {'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 2}, raising=False)
+    return create_app()
+
+
+def test_concurrent_session_writes_fit_the_pool(small_pool_app):
+    def visit(n):
+        client = small_pool_app.test_client()
+        statuses = []
+        for _ in range(5):
+            statuses.append(client.post('/login', data={'username': 'guest', 'password': 'secret'}).status_code)
+            statuses.append(client.get('/dashboard').status_code)
+        return statuses
+
+    with ThreadPoolExecutor(8) as pool:
+        results = [status for statuses in pool.map(visit, range(8)) for status in statuses]
+    assert results.count(302) == 40
+    assert results.count(200) == 40
+
+
+def test_saving_the_session_leaves_the_request_transaction_alone(app):
+    from flask import session
+    from website import db
+    from website.models import Mood
+
+    with app.test_request_context():
+        mood = Mood(name='pending')
+        db.session.add(mood)
+        session['seen'] = True
+        app.session_interface.save_session(app, session._get_current_object(), app.response_class())
+        db.session.rollback()
+        assert db.session.execute(db.select(Mood).where(Mood.name == 'pending')).first() is None
+
+
+def test_streamed_event_page_does_not_reload_the_event(client, login, app):
+    # Saving the popped flashes must not expire what the template renders.
+    from sqlalchemy import event as sa_event
+    from website import db
+
+    login()
+    client.get('/dashboard')
+    with app.app_context():
+        engine = db.engine
+
+    def page_queries(flashes):
+        if flashes:
+            with client.session_transaction() as session:
+                session['_flashes'] = [('success', 'hello')]
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        sa_event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            client.get('/event/1').get_data()
+        finally:
+            sa_event.remove(engine, 'before_cursor_execute', listener)
+        return statements
+
+    plain = page_queries(False)
+    flashed = page_queries(True)
+    assert not any('session_record' in statement for statement in flashed)
+    assert len(flashed) == len(plain)
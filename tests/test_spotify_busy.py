@@ -0,0 +1,39 @@
+from website.rate_limit import RateLimitExceeded
+import website.views as views
+
+
+class FakeSpotify:
+    pass
+
+
+def busy(*args, **kwargs):
+    raise RateLimitExceeded('Spotify call budget exhausted, retry in 2.5s', retry_after=2.5)
+
+
+def test_search_falls_back_to_local_results(client, login, monkeypatch):
+    login()
+    monkeypatch.setattr(views, 'get_spotify_client', lambda: FakeSpotify())
+    monkeypatch.setattr(views, 'search_tracks', busy)
+    response = client.get('/search_songs', query_string={'query': 'anything', 'event_id': 1})
+    assert response.status_code == 200
+
+
+def test_add_song_flashes_when_spotify_is_busy(client, login, monkeypatch):
+    login()
+    monkeypatch.setattr(views, 'get_spotify_client', lambda: FakeSpotify())
+    monkeypatch.setattr(views, 'get_track', busy)
+    response = client.post('/add_song/1/newtrack')
+    assert response.status_code == 302
+    assert 'Spotify is busy' in client.get('/dashboard').get_data(as_text=True)
+
+
+def test_uncaught_budget_errors_are_503s(client, login, monkeypatch):
+    login()
+    monkeypatch.setattr(views, 'search_local_tracks', busy)
+    response = client.get('/typeahead', query_string={'query': 'x'}, headers={'Accept': 'application/json'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+
+    response = client.get('/typeahead', query_string={'query': 'x'}, headers={'Referer': '/events'})
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/events'
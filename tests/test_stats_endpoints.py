@@ -0,0 +1,23 @@
+from config import DevelopmentConfig
+import pytest
+
+
+@pytest.fixture
+def token(monkeypatch):
+    # Set before the app fixture copies the config.
+    monkeypatch.setattr(DevelopmentConfig, 'METRICS_TOKEN', 'scrape')
+    return 'scrape'
+
+
+@pytest.mark.parametrize('path', ['/spotify/pool_stats', '/spotify/scheduler_stats'])
+def test_stats_need_the_metrics_token(token, client, login, path):
+    login()
+    assert client.get(path).status_code == 401
+    response = client.get(path, headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('path', ['/spotify/pool_stats', '/spotify/scheduler_stats'])
+def test_stats_are_closed_without_a_token(client, login, path):
+    login()
+    assert client.get(path).status_code == 404
@@ -0,0 +1,91 @@
+from website import db, token_manager
+from website.models import User
+import threading
+import time
+import pytest
+
+
+class FakeOAuth:
+    def __init__(self, delay=0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def refresh_access_token(self, refresh_token):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError('invalid_grant')
+        return {'access_token': f'fresh{self.calls}', 'refresh_token': refresh_token, 'expires_at': int(time.time()) + 3600}
+
+
+@pytest.fixture
+def oauth(monkeypatch):
+    oauth = FakeOAuth()
+    monkeypatch.setattr('website.spotify_utils.create_spotify_oauth', lambda: oauth)
+    monkeypatch.setattr(token_manager, '_local_active', {})
+    return oauth
+
+
+def expire_in(app, seconds):
+    with app.app_context():
+        db.session.get(User, 1).token_expiry = int(time.time()) + seconds
+        db.session.commit()
+
+
+def test_valid_token_is_not_refreshed(app, oauth):
+    with app.app_context():
+        assert token_manager.get_access_token(1) == 'token'
+    assert oauth.calls == 0
+
+
+def test_expiring_token_is_refreshed_and_saved(app, oauth):
+    expire_in(app, 5)
+    with app.app_context():
+        assert token_manager.get_access_token(1) == 'fresh1'
+        assert db.session.get(User, 1).spotify_token == 'fresh1'
+    assert oauth.calls == 1
+
+
+def test_concurrent_callers_share_one_refresh(app, oauth):
+    oauth.delay = 0.2
+    expire_in(app, 5)
+    tokens = []
+
+    def get():
+        with app.app_context():
+            tokens.append(token_manager.get_access_token(1))
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert tokens == ['fresh1'] * 4
+    assert oauth.calls == 1
+
+
+def test_failed_refresh_returns_no_token(app, oauth):
+    oauth.fail = True
+    expire_in(app, 5)
+    with app.app_context():
+        assert token_manager.get_access_token(1) is None
+
+
+def test_active_users_are_refreshed_ahead_of_expiry(app, oauth):
+    with app.app_context():
+        token_manager.get_access_token(1)
+    expire_in(app, 120)
+    with app.app_context():
+        token_manager.refresh_expiring_tokens(app)
+        assert db.session.get(User, 1).spotify_token == 'fresh1'
+
+
+def test_workers_share_refreshed_tokens_through_redis(app, oauth, fake_redis):
+    expire_in(app, 5)
+    with app.app_context():
+        assert token_manager.get_access_token(1) == 'fresh1'
+        db.session.get(User, 1).spotify_token = 'stale'
+        db.session.commit()
+        assert token_manager.get_access_token(1) == 'fresh1'
+    assert oauth.calls == 1
@@ -0,0 +1,41 @@
+from website import db
+from website.models import Mood, Track
+from website.track_cache import get_tracks, remember_tracks
+
+
+def spotify_track(track_id, name):
+    return {'id': track_id, 'name': name, 'artists': [{'name': 'artist'}], 'album': {'name': 'album'}, 'duration_ms': 1000}
+
+
+class FakeSpotify:
+    def __init__(self):
+        self.calls = []
+
+    def tracks(self, track_ids):
+        self.calls.append(list(track_ids))
+        return {'tracks': [spotify_track(track_id, f'fetched {track_id}') for track_id in track_ids]}
+
+
+def test_remembering_tracks_leaves_the_request_transaction_alone(app):
+    with app.test_request_context():
+        db.session.add(Mood(name='pending'))
+        remember_tracks([spotify_track('track9', 'song 9')])
+        db.session.rollback()
+        assert db.session.execute(db.select(Mood).where(Mood.name == 'pending')).first() is None
+        assert db.session.get(Track, 'track9').title == 'song 9'
+
+
+def test_remembered_tracks_are_updated_in_place(app):
+    with app.app_context():
+        remember_tracks([spotify_track('track9', 'old')])
+        remember_tracks([spotify_track('track9', 'new'), {'id': 'local', 'source': 'local'}])
+        assert [track.title for track in Track.query.all()] == ['new']
+
+
+def test_only_missing_tracks_are_fetched(app):
+    sp = FakeSpotify()
+    with app.app_context():
+        remember_tracks([spotify_track('track8', 'cached')])
+        found = get_tracks(['track8', 'track9', 'track9'], sp)
+        assert sp.calls == [['track9']]
+        assert {track_id: track.title for track_id, track in found.items()} == {'track8': 'cached', 'track9': 'fetched track9'}
@@ -0,0 +1,47 @@
+import pytest
+
+
+def post_votes(client, votes):
+    return client.post('/api/event/1/votes', json={'votes': votes})
+
+
+@pytest.mark.parametrize('entry', [
+    {'song_id': [1], 'action': 'up'},
+    {'song_id': {'id': 1}, 'action': 'up'},
+    {'song_id': True, 'action': 'up'},
+    {'song_id': 'one', 'action': 'up'},
+    {'song_id': 2 ** 40, 'action': 'up'},
+    {'track_id': ['track1'], 'action': 'up'},
+    {'action': 'up'},
+    {'song_id': 1, 'action': 'sideways'},
+    'up',
+])
+def test_malformed_votes_are_rejected(client, login, entry):
+    login()
+    response = post_votes(client, [{'song_id': 2, 'action': 'up'}, entry])
+    assert response.status_code == 400
+    assert post_votes(client, [{'song_id': 2, 'action': 'clear'}]).get_json()['votes'][0]['upvotes'] == 0
+
+
+def test_unknown_songs_do_not_fail_the_batch(client, login):
+    login()
+    response = post_votes(client, [
+        {'song_id': 1, 'action': 'up'},
+        {'track_id': 'not-in-event', 'action': 'up'},
+        {'song_id': '3', 'action': 'down'},
+        {'song_id': 999, 'action': 'up'},
+    ])
+    assert response.status_code == 200
+    data = response.get_json()
+    assert {vote['song_id']: vote['vote'] for vote in data['votes']} == {1: 1, 3: -1}
+    assert data['unknown'] == [
+        {'track_id': 'not-in-event', 'action': 'up'},
+        {'song_id': 999, 'action': 'up'},
+    ]
+
+
+def test_only_unknown_songs(client, login):
+    login()
+    response = post_votes(client, [{'track_id': 'not-in-event', 'action': 'up'}])
+    assert response.status_code == 200
+    assert response.get_json()['votes'] == []
@@ -0,0 +1,49 @@
+from website import db
+from website.models import Song, Vote
+from website.vote_engine import (
+    apply_votes, flush_votes, LOG_KEY, PROCESSING_KEY, DEAD_LETTER_KEY
+)
+import json
+import pytest
+
+
+@pytest.fixture
+def ctx(app, fake_redis):
+    # Flushes only when the test asks for one.
+    app.config['VOTE_FLUSH_INTERVAL'] = 3600
+    with app.test_request_context():
+        yield fake_redis
+
+
+def votes():
+    return set(db.session.execute(db.select(Vote.user_id, Vote.song_id, Vote.value)).all())
+
+
+def test_votes_for_deleted_songs_are_dropped(app, ctx):
+    apply_votes(2, 1, [(1, 'up'), (2, 'down')])
+    db.session.execute(db.delete(Song).where(Song.id == 1))
+    db.session.commit()
+
+    assert flush_votes(app) == 2
+    assert votes() == {(2, 2, -1)}
+    assert ctx.llen(PROCESSING_KEY) == 0
+
+
+def test_poison_batch_is_dead_lettered(app, ctx):
+    app.config['VOTE_FLUSH_MAX_ATTEMPTS'] = 3
+    ctx.rpush(PROCESSING_KEY, json.dumps({'action': 'set', 'user_id': 2}))
+    apply_votes(2, 1, [(3, 'up')])
+
+    for _ in range(2):
+        with pytest.raises(Exception):
+            flush_votes(app)
+        assert ctx.llen(PROCESSING_KEY) == 1
+    with pytest.raises(Exception):
+        flush_votes(app)
+    assert ctx.llen(PROCESSING_KEY) == 0
+    assert ctx.llen(DEAD_LETTER_KEY) == 1
+
+    # Votes logged behind the poison batch reach the database again.
+    assert flush_votes(app) == 1
+    assert votes() == {(2, 3, 1)}
+    assert ctx.llen(LOG_KEY) == 0
@@ -0,0 +1,44 @@
+from website.vote_engine import apply_votes, get_event_tallies, flush_votes, _loaded_key
+import website.vote_engine as vote_engine
+import pytest
+import redis
+
+
+@pytest.fixture
+def ctx(app, fake_redis):
+    app.config['VOTE_FLUSH_INTERVAL'] = 3600
+    with app.test_request_context():
+        yield fake_redis
+
+
+def fail_scripts(monkeypatch):
+    def script(client, source):
+        def run(*args, **kwargs):
+            raise redis.ConnectionError('redis went away')
+        return run
+    monkeypatch.setattr(vote_engine, '_script', script)
+
+
+def test_votes_during_an_outage_are_in_redis_after_recovery(app, ctx, monkeypatch):
+    # Logged in redis but not yet flushed when the outage starts.
+    apply_votes(1, 1, [(1, 'up')])
+
+    with monkeypatch.context() as patch:
+        fail_scripts(patch)
+        assert apply_votes(2, 1, [(1, 'up'), (2, 'down')]) == {1: (1, 1, 0), 2: (-1, 0, 1)}
+
+    # The fallback write dropped the marker, so redis is rebuilt from the
+    # database and the unflushed log.
+    assert not ctx.exists(_loaded_key(1))
+    tallies = get_event_tallies(1)
+    assert tallies[1] == (2, 0)
+    assert tallies[2] == (0, 1)
+
+    assert flush_votes(app) == 1
+    assert apply_votes(2, 1, [(2, 'clear')])[2] == (0, 0, 0)
+    assert get_event_tallies(1)[1] == (2, 0)
+
+
+def test_loaded_marker_expires(app, ctx):
+    get_event_tallies(1)
+    assert 0 < ctx.ttl(_loaded_key(1)) <= app.config['VOTE_HYDRATE_TTL']
@@ -21,16 +21,25 @@ def create_app():
     login_manager.login_view = 'auth.login'
     migrate = Migrate(app, db)
 
+    from .sessions import ServerSessionInterface
+    app.session_interface = ServerSessionInterface()
+
+    from .query_stats import init_query_stats
+    init_query_stats(app)
+
+    from .metrics import init_metrics
+    init_metrics(app)
+
     from .views import views
     from .auth import auth
 
     app.register_blueprint(views, url_prefix='/')
     app.register_blueprint(auth, url_prefix='/')
 
-    from .models import User
+    from .user_cache import load_user_snapshot
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_user_snapshot(int(user_id))
 
     return app
\ No newline at end of file
@@ -1,23 +1,14 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
 from werkzeug.security import generate_password_hash, check_password_hash
+from flask_login import login_user
 from .models import db, User
+from .spotify_utils import create_spotify_oauth, create_spotify_client
+from . import token_manager
+from .user_cache import invalidate_user
 from sqlalchemy.exc import IntegrityError
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-import time
 
 auth = Blueprint('auth', __name__)
 
-def create_spotify_oauth():
-    return SpotifyOAuth(
-        client_id=current_app.config['SPOTIPY_CLIENT_ID'],
-        client_secret=current_app.config['SPOTIPY_CLIENT_SECRET'],
-        redirect_uri=current_app.config['SPOTIPY_REDIRECT_URI'],
-        scope="user-library-read playlist-modify-public playlist-modify-private",
-        cache_handler=None,
-        show_dialog=True
-    )
-
 @auth.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -39,7 +30,9 @@ def register():
         db.session.add(new_user)
         db.session.commit()
         
+        session.regenerate()
         session['user_id'] = new_user.id
+        login_user(new_user)
         flash('Registration successful. Please link your Spotify account.', 'success')
         return redirect(url_for('auth.spotify_login'))
     
@@ -53,7 +46,9 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and check_password_hash(user.password_hash, password):
+            session.regenerate()
             session['user_id'] = user.id
+            login_user(user)
             if not user.spotify_id:
                 flash('Please link your Spotify account to continue.', 'warning')
                 return redirect(url_for('auth.spotify_login'))
@@ -82,7 +77,6 @@ def callback():
         return redirect(url_for('auth.login'))
 
     sp_oauth = create_spotify_oauth()
-    session.pop('token_info', None)
     code = request.args.get('code')
     
     try:
@@ -95,9 +89,7 @@ def callback():
         flash('Failed to get access token from Spotify. Please try again.', 'danger')
         return redirect(url_for('auth.spotify_login'))
 
-    session['token_info'] = token_info
-
-    sp = spotipy.Spotify(auth=token_info['access_token'])
+    sp = create_spotify_client(auth=token_info['access_token'])
     spotify_user_info = sp.me()
     
     user = User.query.get(session['user_id'])
@@ -107,10 +99,9 @@ def callback():
 
     try:
         user.spotify_id = spotify_user_info['id']
-        user.spotify_token = token_info['access_token']
-        user.refresh_token = token_info['refresh_token']
-        user.token_expiry = int(token_info['expires_at'])
-        db.session.commit()
+        # The token store commits the spotify_id along with the tokens.
+        token_manager.save_token(user.id, token_info)
+        invalidate_user(user.id)
         flash('Spotify account linked successfully!', 'success')
     except IntegrityError:
         db.session.rollback()
@@ -122,24 +113,10 @@ def callback():
 @auth.route('/logout')
 def logout():
     session.clear()
+    session.regenerate()
     flash('You have been logged out.', 'success')
     return redirect(url_for('auth.login'))
 
-def get_token():
-    token_info = session.get('token_info', None)
-    if not token_info:
-        return None
-
-    now = int(time.time())
-    is_expired = token_info['expires_at'] - now < 60
-
-    if is_expired:
-        sp_oauth = create_spotify_oauth()
-        token_info = sp_oauth.refresh_access_token(token_info['refresh_token'])
-        session['token_info'] = token_info
-
-    return token_info['access_token']
-
 @auth.route('/refresh_token')
 def refresh_token():
     if 'user_id' not in session:
@@ -149,40 +126,11 @@ def refresh_token():
     if not user or not user.refresh_token:
         return redirect(url_for('auth.spotify_login'))
 
-    sp_oauth = create_spotify_oauth()
-    token_info = sp_oauth.refresh_access_token(user.refresh_token)
-
-    user.spotify_token = token_info['access_token']
-    user.refresh_token = token_info['refresh_token']
-    user.token_expiry = int(token_info['expires_at'])
-    db.session.commit()
-
-    session['token_info'] = token_info
-    return redirect(url_for('views.dashboard'))
-    if 'user_id' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.get(session['user_id'])
-    if not user or not user.refresh_token:
+    try:
+        token_manager.refresh_token(user.id, force=True)
+        invalidate_user(user.id)
+    except Exception as e:
+        current_app.logger.error(f"Error refreshing Spotify token: {str(e)}")
+        flash('Failed to refresh your Spotify connection. Please link it again.', 'danger')
         return redirect(url_for('auth.spotify_login'))
-
-    token_info = refresh_token(user.refresh_token)
-    session['token_info'] = token_info
     return redirect(url_for('views.dashboard'))
-    if 'user_id' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.get(session['user_id'])
-    if not user or not user.refresh_token:
-        return redirect(url_for('auth.spotify_login'))
-
-    sp_oauth = create_spotify_oauth()
-    token_info = sp_oauth.refresh_access_token(user.refresh_token)
-
-    user.spotify_token = token_info['access_token']
-    user.refresh_token = token_info['refresh_token']
-    user.token_expiry = int(token_info['expires_at'])
-    db.session.commit()
-
-    session['token_info'] = token_info
-    return redirect(url_for('views.dashboard'))
\ No newline at end of file
@@ -0,0 +1,37 @@
+import os
+import threading
+
+_threads = {}
+_lock = threading.Lock()
+
+def ensure_periodic(app, name, interval, fn):
+    # One thread per name per worker process. Threads do not survive a fork,
+    # so they are keyed by pid and started lazily rather than at import time.
+    key = (os.getpid(), name)
+    if key in _threads:
+        return
+    with _lock:
+        if key in _threads:
+            return
+        stop = threading.Event()
+        thread = threading.Thread(target=_run, args=(app, name, interval, fn, stop), name=name, daemon=True)
+        _threads[key] = (thread, stop)
+        thread.start()
+
+def _run(app, name, interval, fn, stop):
+    while not stop.wait(interval):
+        try:
+            with app.app_context():
+                fn(app)
+        except Exception as e:
+            app.logger.error(f"Background task {name} failed: {str(e)}")
+
+def stop_background_threads(timeout=5):
+    with _lock:
+        threads = [entry for key, entry in _threads.items() if key[0] == os.getpid()]
+        for key in [key for key in _threads if key[0] == os.getpid()]:
+            del _threads[key]
+    for thread, stop in threads:
+        stop.set()
+    for thread, stop in threads:
+        thread.join(timeout)
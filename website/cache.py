@@ -0,0 +1,199 @@
+from flask import current_app
+from collections import OrderedDict
+import copy
+import json
+import threading
+import time
+import redis
+
+_redis_clients = {}
+_redis_lock = threading.Lock()
+
+def get_redis(app=None):
+    config = (app or current_app).config
+    url = config.get('REDIS_URL')
+    if not url:
+        return None
+
+    with _redis_lock:
+        client = _redis_clients.get(url)
+        if client is None:
+            client = redis.Redis.from_url(
+                url,
+                decode_responses=True,
+                socket_timeout=config['REDIS_SOCKET_TIMEOUT'],
+                socket_connect_timeout=config['REDIS_SOCKET_TIMEOUT']
+            )
+            _redis_clients[url] = client
+    return client
+
+
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution.
+
+    Followers block until the leader finishes and get a copy of its result, or
+    its exception re-raised.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        return len(self._calls)
+
+
+class Cache:
+    """JSON cache stored in redis when REDIS_URL is set, in an in-process LRU otherwise.
+
+    Redis errors are logged and the local LRU is used for that call, so a redis
+    outage degrades to per-worker caching instead of failing the request.
+    """
+
+    def __init__(self, namespace, maxsize=256):
+        self.namespace = namespace
+        self.local = LRUCache(maxsize)
+        self.in_flight = SingleFlight()
+
+    def _key(self, key):
+        return f'drolg:{self.namespace}:{key}'
+
+    def get(self, key):
+        client = get_redis()
+        if client is not None:
+            try:
+                raw = client.get(self._key(key))
+                return json.loads(raw) if raw is not None else None
+            except redis.RedisError as e:
+                current_app.logger.warning(f"Redis get failed for {self.namespace}: {str(e)}")
+        return self.local.get(key)
+
+    def set(self, key, value, ttl=None):
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(self._key(key), json.dumps(value), ex=ttl)
+                return
+            except redis.RedisError as e:
+                current_app.logger.warning(f"Redis set failed for {self.namespace}: {str(e)}")
+        self.local.set(key, value, ttl)
+
+    def delete(self, key):
+        client = get_redis()
+        if client is not None:
+            try:
+                client.delete(self._key(key))
+            except redis.RedisError as e:
+                current_app.logger.warning(f"Redis delete failed for {self.namespace}: {str(e)}")
+        self.local.delete(key)
+
+    def get_or_compute(self, key, compute, ttl=None, lock_timeout=5):
+        value = self.get(key)
+        if value is not None:
+            return value
+        return self.in_flight.do(key, lambda: self._compute(key, compute, ttl, lock_timeout))
+
+    def _compute(self, key, compute, ttl, lock_timeout):
+        # Only one worker computes a missing key; the others poll the cache
+        # until the leader fills it, or compute it themselves if it never does.
+        client = get_redis()
+        if client is not None:
+            lock_key = self._key(key) + ':lock'
+            try:
+                if not client.set(lock_key, 1, nx=True, px=int(lock_timeout * 1000)):
+                    deadline = time.monotonic() + lock_timeout
+                    while time.monotonic() < deadline:
+                        time.sleep(0.05)
+                        value = self.get(key)
+                        if value is not None:
+                            return value
+                        if not client.exists(lock_key):
+                            break
+            except redis.RedisError as e:
+                current_app.logger.warning(f"Redis lock failed for {self.namespace}: {str(e)}")
+
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        self.set(key, value, ttl)
+        if client is not None:
+            try:
+                client.delete(lock_key)
+            except redis.RedisError:
+                pass
+        return value
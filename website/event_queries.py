@@ -0,0 +1,46 @@
+from sqlalchemy.orm import joinedload, selectinload, undefer
+from .models import db, Event, user_event
+
+# Every listing loads what its template touches up front, so a page costs the
+# same number of queries whether the user has one event or a hundred.
+
+def _listing_options():
+    return (
+        joinedload(Event.host),
+        joinedload(Event.mood),
+        undefer(Event.attendee_count)
+    )
+
+def hosted_events(user_id):
+    return db.session.execute(
+        db.select(Event)
+        .where(Event.host_id == user_id)
+        .options(*_listing_options())
+        .order_by(Event.date_event)
+    ).scalars().all()
+
+def joined_events(user_id):
+    return db.session.execute(
+        db.select(Event)
+        .join(user_event, user_event.c.event_id == Event.id)
+        .where(user_event.c.user_id == user_id)
+        .options(*_listing_options())
+        .order_by(Event.date_event)
+    ).scalars().all()
+
+def event_for_view(event_id):
+    return db.first_or_404(
+        db.select(Event)
+        .where(Event.id == event_id)
+        .options(joinedload(Event.host), joinedload(Event.mood), selectinload(Event.attendees))
+    )
+
+def is_attendee(event_id, user_id):
+    # A primary key lookup on user_event instead of loading every attendee.
+    return db.session.execute(
+        db.select(user_event.c.user_id)
+        .where(user_event.c.event_id == event_id, user_event.c.user_id == user_id)
+    ).first() is not None
+
+def can_access_event(event, user_id):
+    return event.host_id == user_id or is_attendee(event.id, user_id)
@@ -0,0 +1,233 @@
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta
+from .background import ensure_periodic
+from .models import db, Job
+import json
+import random
+import signal
+import threading
+import time
+
+# Slow side effects (Spotify writes, cache warming) run as jobs rather than
+# inside request workers. Jobs are rows in the job table, written in the same
+# transaction as the change that caused them, and run by `python worker.py`
+# (or by a thread in the web process when JOBS_IN_PROCESS is set).
+#
+# A worker claims a job by flipping it from queued to running with a guarded
+# UPDATE, so two workers never run the same job. Jobs with the same queue_key
+# run one at a time in id order, which keeps each event's Spotify writes in
+# the order they were made. A job enqueued with a delay takes its place in
+# that order once it is due; a job waiting to be retried holds its place.
+# A failed job is retried with exponential backoff and gives up after
+# max_attempts. An idempotency key makes enqueueing the same work twice a
+# no-op for as long as the finished job is kept.
+_handlers = {}
+
+
+class Handler:
+    def __init__(self, fn, batch):
+        self.fn = fn
+        self.batch = batch
+
+
+def job_handler(name, batch=None):
+    # batch=n hands up to n consecutive queued jobs of this name from the
+    # same queue to one call as a list of payloads; otherwise the payload is
+    # passed as keyword arguments.
+    def register(fn):
+        _handlers[name] = Handler(fn, batch)
+        return fn
+    return register
+
+def enqueue(name, payload, key=None, queue=None, delay=0, max_attempts=None):
+    # Added to the caller's session; the job exists once the caller commits.
+    if key is not None:
+        existing = db.session.execute(db.select(Job).where(Job.idempotency_key == key)).scalar()
+        if existing is not None:
+            return existing
+
+    job = Job(
+        name=name,
+        payload=json.dumps(payload),
+        queue_key=queue,
+        idempotency_key=key,
+        max_attempts=max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(job)
+    except IntegrityError:
+        # Enqueued concurrently under the same key.
+        return db.session.execute(db.select(Job).where(Job.idempotency_key == key)).scalar_one()
+
+    if current_app.config['JOBS_IN_PROCESS']:
+        app = current_app._get_current_object()
+        ensure_periodic(app, 'job-runner', app.config['JOB_POLL_INTERVAL'], run_due_jobs)
+        ensure_periodic(app, 'job-pruner', 3600, prune_jobs)
+    return job
+
+def _backoff(app, attempts):
+    delay = min(app.config['JOB_BACKOFF_BASE'] * 2 ** (attempts - 1), app.config['JOB_BACKOFF_MAX'])
+    return delay * random.uniform(0.8, 1.2)
+
+def _claim_one(job_id, now, lease):
+    # run_at is checked again: the job may have failed and been requeued
+    # for later since the caller selected it.
+    return db.session.execute(
+        db.update(Job)
+        .where(Job.id == job_id, Job.status == 'queued', Job.run_at <= now)
+        .values(status='running', attempts=Job.attempts + 1, locked_until=now + lease)
+    ).rowcount == 1
+
+def _in_line(job, now):
+    # Jobs that hold their place in a queue: running ones, due ones, and ones
+    # that have failed and are waiting to be retried.
+    return db.or_(
+        job.status == 'running',
+        db.and_(job.status == 'queued', db.or_(job.run_at <= now, job.attempts > 0))
+    )
+
+def _claim(app):
+    now = datetime.utcnow()
+    lease = timedelta(seconds=app.config['JOB_LEASE'])
+    earlier = aliased(Job)
+    blocked = (
+        db.select(earlier.id)
+        .where(earlier.queue_key == Job.queue_key, earlier.id < Job.id, _in_line(earlier, now))
+        .exists()
+    )
+    candidates = db.session.execute(
+        db.select(Job.id)
+        .where(Job.status == 'queued', Job.run_at <= now, db.or_(Job.queue_key.is_(None), ~blocked))
+        .order_by(Job.run_at, Job.id)
+        .limit(10)
+    ).scalars().all()
+
+    for job_id in candidates:
+        if not _claim_one(job_id, now, lease):
+            continue
+        jobs = [db.session.get(Job, job_id)]
+        handler = _handlers.get(jobs[0].name)
+        if handler is not None and handler.batch and jobs[0].queue_key is not None:
+            followers = db.session.execute(
+                db.select(Job)
+                .where(Job.queue_key == jobs[0].queue_key, Job.id > job_id, _in_line(Job, now))
+                .order_by(Job.id)
+                .limit(handler.batch - 1)
+            ).scalars().all()
+            for follower in followers:
+                # Only the unbroken run of same-named jobs, so order is kept.
+                if follower.name != jobs[0].name or not _claim_one(follower.id, now, lease):
+                    break
+                jobs.append(follower)
+        db.session.commit()
+        return jobs
+    db.session.commit()
+    return []
+
+def _finish(jobs):
+    db.session.execute(
+        db.update(Job).where(Job.id.in_([job.id for job in jobs]))
+        .values(status='done', locked_until=None, last_error=None)
+    )
+    db.session.commit()
+
+def _fail(app, jobs, error):
+    now = datetime.utcnow()
+    for job in jobs:
+        if job.attempts >= job.max_attempts:
+            values = {'status': 'failed', 'locked_until': None, 'last_error': error}
+            app.logger.error(f"Job {job.id} ({job.name}) failed after {job.attempts} attempt(s): {error}")
+        else:
+            values = {
+                'status': 'queued', 'locked_until': None, 'last_error': error,
+                'run_at': now + timedelta(seconds=_backoff(app, job.attempts))
+            }
+            app.logger.warning(f"Job {job.id} ({job.name}) attempt {job.attempts} failed, retrying: {error}")
+        db.session.execute(db.update(Job).where(Job.id == job.id).values(**values))
+    db.session.commit()
+
+def _release_expired(app):
+    # Jobs whose worker died mid-run go back to the queue, or fail if that
+    # was their last attempt.
+    now = datetime.utcnow()
+    expired = db.session.execute(
+        db.select(Job).where(Job.status == 'running', Job.locked_until < now)
+    ).scalars().all()
+    if expired:
+        _fail(app, expired, 'Worker lease expired')
+
+def run_next_job(app):
+    jobs = _claim(app)
+    if not jobs:
+        return 0
+
+    handler = _handlers.get(jobs[0].name)
+    started = time.perf_counter()
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for job {jobs[0].name}')
+        payloads = [json.loads(job.payload) for job in jobs]
+        if handler.batch:
+            handler.fn(payloads)
+        else:
+            handler.fn(**payloads[0])
+    except Exception as e:
+        db.session.rollback()
+        _fail(app, jobs, str(e) or e.__class__.__name__)
+        return len(jobs)
+
+    _finish(jobs)
+    app.logger.info(f"Ran {len(jobs)} {jobs[0].name} job(s) in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return len(jobs)
+
+def run_due_jobs(app, limit=100):
+    _release_expired(app)
+    ran = 0
+    while ran < limit:
+        count = run_next_job(app)
+        if not count:
+            break
+        ran += count
+    return ran
+
+def prune_jobs(app):
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['JOB_RETENTION'])
+    db.session.execute(
+        db.delete(Job).where(Job.status.in_(('done', 'failed')), Job.updated_at < cutoff)
+    )
+    db.session.commit()
+
+def run_worker(app, threads=None):
+    threads = threads or app.config['JOB_WORKER_THREADS']
+    stop = threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            try:
+                with app.app_context():
+                    ran = run_due_jobs(app)
+            except Exception as e:
+                app.logger.error(f"Job worker error: {str(e)}")
+                ran = 0
+            if not ran:
+                stop.wait(app.config['JOB_POLL_INTERVAL'])
+
+    def shutdown(signum, frame):
+        app.logger.info('Job worker stopping')
+        stop.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    ensure_periodic(app, 'job-pruner', 3600, prune_jobs)
+
+    workers = [threading.Thread(target=loop, name=f'job-worker-{n}', daemon=True) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    app.logger.info(f"Job worker started with {threads} thread(s)")
+    while any(worker.is_alive() for worker in workers):
+        for worker in workers:
+            worker.join(0.5)
@@ -0,0 +1,117 @@
+from flask import current_app
+from collections import defaultdict
+from .cache import get_redis
+import json
+import os
+import queue
+import redis
+import threading
+import time
+
+CHANNEL_PREFIX = 'drolg:event:'
+
+
+class Broker:
+    """Fans event updates out to the SSE streams open in this worker.
+
+    With redis every worker runs one pub/sub listener that feeds its broker,
+    so an update published by any worker reaches every connected guest.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def subscribe(self, event_id):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[event_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, event_id, subscriber):
+        with self._lock:
+            self._subscribers[event_id].discard(subscriber)
+            if not self._subscribers[event_id]:
+                del self._subscribers[event_id]
+
+    def publish_local(self, event_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event_id, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A stalled client misses updates rather than holding memory.
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def ensure_listener(self, app):
+        if self._listener_pid == os.getpid() or get_redis(app) is None:
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen, args=(app,), name='live-listener', daemon=True).start()
+
+    def _listen(self, app):
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis(app).pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(CHANNEL_PREFIX + '*')
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message['type'] == 'pmessage':
+                        event_id = int(message['channel'][len(CHANNEL_PREFIX):])
+                        self.publish_local(event_id, message['data'])
+            except (redis.RedisError, ValueError) as e:
+                app.logger.warning(f"Live update listener lost redis, reconnecting: {str(e)}")
+                time.sleep(1)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except redis.RedisError:
+                        pass
+
+
+broker = Broker()
+
+def publish_event_update(event_id, update_type, **data):
+    message = json.dumps({'type': update_type, **data})
+    client = get_redis()
+    if client is not None:
+        try:
+            client.publish(f'{CHANNEL_PREFIX}{event_id}', message)
+            return
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Redis publish failed, updating this worker only: {str(e)}")
+    broker.publish_local(event_id, message)
+
+def stream_event_updates(event_id):
+    app = current_app._get_current_object()
+    heartbeat = app.config['SSE_HEARTBEAT_INTERVAL']
+    deadline = time.monotonic() + app.config['SSE_STREAM_TIMEOUT']
+
+    broker.ensure_listener(app)
+    subscriber = broker.subscribe(event_id)
+    try:
+        # Streams are closed periodically so workers are not held forever;
+        # EventSource reconnects after the retry delay.
+        yield 'retry: 2000\n\n'
+        while time.monotonic() < deadline:
+            try:
+                message = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            update_type = json.loads(message)['type']
+            yield f'event: {update_type}\ndata: {message}\n\n'
+    finally:
+        broker.unsubscribe(event_id, subscriber)
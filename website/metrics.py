@@ -0,0 +1,152 @@
+from flask import has_request_context, request
+from collections import defaultdict
+from urllib.parse import urlsplit
+import bisect
+import threading
+
+# Per worker process; Prometheus sums the series across workers when it
+# scrapes each of them.
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Path segments that follow these are ids and are collapsed so the series
+# count stays bounded.
+ID_PARENTS = {
+    'albums', 'artists', 'audio-analysis', 'audio-features', 'audiobooks',
+    'categories', 'episodes', 'playlists', 'shows', 'tracks', 'users'
+}
+
+_TIMING_KEY = 'drolg.spotify_timing'
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class SpotifyMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(Histogram)
+        self.response_bytes = defaultdict(int)
+        self.retries = defaultdict(int)
+
+    def record(self, endpoint, method, status, latency, retries, nbytes):
+        labels = (endpoint, method, str(status))
+        with self._lock:
+            self.latency[labels].observe(latency)
+            self.response_bytes[labels] += nbytes
+            self.retries[labels] += retries
+
+    def render(self):
+        with self._lock:
+            latency = {labels: (list(hist.cumulative()), hist.sum, hist.count) for labels, hist in self.latency.items()}
+            response_bytes = dict(self.response_bytes)
+            retries = dict(self.retries)
+
+        lines = [
+            '# HELP drolg_spotify_request_duration_seconds Time to Spotify response headers.',
+            '# TYPE drolg_spotify_request_duration_seconds histogram'
+        ]
+        for labels, (buckets, total, count) in sorted(latency.items()):
+            base = _labels(labels)
+            for bound, cumulative in buckets:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'drolg_spotify_request_duration_seconds_bucket{{{base},le="{le}"}} {cumulative}')
+            lines.append(f'drolg_spotify_request_duration_seconds_sum{{{base}}} {total}')
+            lines.append(f'drolg_spotify_request_duration_seconds_count{{{base}}} {count}')
+
+        lines += [
+            '# HELP drolg_spotify_response_bytes_total Response body bytes received from Spotify.',
+            '# TYPE drolg_spotify_response_bytes_total counter'
+        ]
+        lines += [f'drolg_spotify_response_bytes_total{{{_labels(labels)}}} {value}' for labels, value in sorted(response_bytes.items())]
+
+        lines += [
+            '# HELP drolg_spotify_retries_total Transport level retries made before the response.',
+            '# TYPE drolg_spotify_retries_total counter'
+        ]
+        lines += [f'drolg_spotify_retries_total{{{_labels(labels)}}} {value}' for labels, value in sorted(retries.items())]
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTiming:
+    # Spotify time spent on behalf of one Flask request, including calls made
+    # from the playlist page threads, which share the request object.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.total = 0.0
+
+    def add(self, latency):
+        with self._lock:
+            self.calls += 1
+            self.total += latency
+
+
+spotify_metrics = SpotifyMetrics()
+
+def _labels(labels):
+    endpoint, method, status = labels
+    return f'endpoint="{endpoint}",method="{method}",status="{status}"'
+
+def normalize_endpoint(url):
+    parts = urlsplit(url)
+    if parts.path.rstrip('/').endswith('/api/token'):
+        return 'token'
+
+    segments = [segment for segment in parts.path.split('/') if segment]
+    if segments and segments[0] == 'v1':
+        segments = segments[1:]
+    normalized = []
+    for segment in segments:
+        normalized.append('{id}' if normalized and normalized[-1] in ID_PARENTS and segment not in ID_PARENTS else segment)
+    return '/'.join(normalized) or '/'
+
+def record_spotify_response(response, *args, **kwargs):
+    # requests response hook on the shared Spotify session, so it sees Web API
+    # calls and token exchanges alike.
+    latency = response.elapsed.total_seconds()
+    retries = getattr(response.raw, 'retries', None)
+    spotify_metrics.record(
+        normalize_endpoint(response.request.url),
+        response.request.method,
+        response.status_code,
+        latency,
+        len(retries.history) if retries is not None else 0,
+        len(response.content or b'')
+    )
+    if has_request_context():
+        timing = request.environ.get(_TIMING_KEY)
+        if timing is not None:
+            timing.add(latency)
+    return response
+
+def init_metrics(app):
+    @app.before_request
+    def start_spotify_timing():
+        request.environ[_TIMING_KEY] = RequestTiming()
+
+    @app.after_request
+    def report_spotify_timing(response):
+        timing = request.environ.get(_TIMING_KEY)
+        if timing is None or not timing.calls:
+            return response
+
+        entry = f'spotify;dur={timing.total * 1000:.1f};desc="{timing.calls} calls"'
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f'{existing}, {entry}' if existing else entry
+        return response
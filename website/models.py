@@ -22,10 +22,11 @@ class Event(db.Model):
     end_time = db.Column(db.DateTime, nullable=False)
     duration = db.Column(db.Interval, nullable=False)
     invite_code = db.Column(db.String(150), unique=True, nullable=False)
-    host_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    host_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     spotify_playlist_id = db.Column(db.String(150), nullable=False)
     mood_id = db.Column(db.Integer, db.ForeignKey('mood.id'), nullable=False)
     playlists = db.relationship('Playlist', backref='event', lazy=True)
+    host = db.relationship('User', foreign_keys=[host_id])
     attendees = db.relationship('User', secondary='user_event', back_populates='joined_events')
 
     def calculate_duration(self):
@@ -39,7 +40,7 @@ class Mood(db.Model):
 class Playlist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
-    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False, index=True)
     songs = db.relationship('Song', backref='playlist', lazy=True)
 
 class Song(db.Model):
@@ -47,17 +48,74 @@ class Song(db.Model):
     title = db.Column(db.String(150), nullable=False)
     artist = db.Column(db.String(150), nullable=False)
     spotify_track_id = db.Column(db.String(150), nullable=False)
-    playlist_id = db.Column(db.Integer, db.ForeignKey('playlist.id'), nullable=False)
+    playlist_id = db.Column(db.Integer, db.ForeignKey('playlist.id'), nullable=False, index=True)
     mood_id = db.Column(db.Integer, db.ForeignKey('mood.id'), nullable=False)
+    # vote_count is the number of upvotes. score is the signed Wilson score
+    # kept up to date by vote_engine and is what the play queue ranks by.
+    vote_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    downvotes = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    score = db.Column(db.Float, nullable=False, default=0, server_default='0')
     votes = db.relationship('Vote', backref='song', lazy=True)
+    __table_args__ = (
+        db.Index('ix_song_playlist_id_score', 'playlist_id', 'score'),
+    )
+
+class Track(db.Model):
+    spotify_track_id = db.Column(db.String(150), primary_key=True)
+    title = db.Column(db.String(150), nullable=False)
+    artist = db.Column(db.String(150), nullable=False)
+    album = db.Column(db.String(150), nullable=True)
+    duration_ms = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SessionRecord(db.Model):
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expiry = db.Column(db.DateTime, nullable=False, index=True)
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    # Jobs sharing a queue_key run one at a time in id order.
+    queue_key = db.Column(db.String(64), nullable=True, index=True)
+    idempotency_key = db.Column(db.String(150), nullable=True, unique=True)
+    status = db.Column(db.String(16), nullable=False, default='queued', server_default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False, default=5, server_default='5')
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
 
 class Vote(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    song_id = db.Column(db.Integer, db.ForeignKey('song.id'), nullable=False)
+    song_id = db.Column(db.Integer, db.ForeignKey('song.id'), nullable=False, index=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    # 1 for an upvote, -1 for a downvote.
+    value = db.Column(db.SmallInteger, nullable=False, default=1, server_default='1')
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'song_id', name='uq_vote_user_song'),
+        db.Index('ix_vote_event_id_song_id', 'event_id', 'song_id'),
+    )
 
 user_event = db.Table('user_event',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('event_id', db.Integer, db.ForeignKey('event.id'), primary_key=True)
-)
\ No newline at end of file
+    db.Column('event_id', db.Integer, db.ForeignKey('event.id'), primary_key=True),
+    db.Index('ix_user_event_event_id', 'event_id')
+)
+
+# Counted in SQL when a query asks for it with undefer(), instead of loading
+# every attendee just to take len().
+Event.attendee_count = db.column_property(
+    db.select(db.func.count(user_event.c.user_id))
+    .where(user_event.c.event_id == Event.id)
+    .correlate_except(user_event)
+    .scalar_subquery(),
+    deferred=True
+)
@@ -0,0 +1,43 @@
+from .models import Song
+from .vote_engine import ranked_songs, song_rank, get_tallies
+
+def _song_entries(event_id, ranked, start):
+    song_ids = [song_id for song_id, _ in ranked]
+    songs = {
+        song.id: song
+        for song in Song.query.filter(Song.id.in_(song_ids)).all()
+    } if ranked else {}
+    tallies = get_tallies(event_id, song_ids)
+
+    entries = []
+    for position, (song_id, score) in enumerate(ranked, start=start):
+        song = songs.get(song_id)
+        if song is None:
+            continue
+        upvotes, downvotes = tallies.get(song_id, (0, 0))
+        entries.append({
+            'rank': position + 1,
+            'song_id': song.id,
+            'spotify_track_id': song.spotify_track_id,
+            'title': song.title,
+            'artist': song.artist,
+            'upvotes': upvotes,
+            'downvotes': downvotes,
+            'score': score
+        })
+    return entries
+
+def top_k(event_id, k=10, start=0):
+    return _song_entries(event_id, ranked_songs(event_id, start=start, count=k), start)
+
+def next_up(event_id, exclude=()):
+    # The highest ranked song not in exclude (e.g. the one playing now).
+    ranked = ranked_songs(event_id, count=len(exclude) + 1)
+    for entry in _song_entries(event_id, ranked, 0):
+        if entry['song_id'] not in exclude:
+            return entry
+    return None
+
+def rank_of(event_id, song_id):
+    rank = song_rank(event_id, song_id)
+    return None if rank is None else rank + 1
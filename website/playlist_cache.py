@@ -0,0 +1,86 @@
+from flask import current_app, copy_current_request_context, has_request_context
+from concurrent.futures import ThreadPoolExecutor
+from spotipy.exceptions import SpotifyException
+from .cache import Cache
+from .rate_limit import RateLimitExceeded
+import time
+
+_playlists = Cache('playlist', maxsize=256)
+
+def get_playlist_snapshot_id(sp, playlist_id):
+    return sp.playlist(playlist_id, fields='snapshot_id')['snapshot_id']
+
+def _playable(items):
+    # Local files and tracks removed from Spotify come back with track=None.
+    return [item for item in items if item.get('track')]
+
+def _with_context(fn):
+    # The client reads its token from the session, so page fetches need a
+    # copy of the request context in the pool threads.
+    return copy_current_request_context(fn) if has_request_context() else fn
+
+def _mark_latest(playlist_id, snapshot_id, ttl):
+    _playlists.set(f'{playlist_id}:latest', {'snapshot_id': snapshot_id, 'fetched_at': time.time()}, ttl=ttl)
+
+def cached_playlist_tracks(playlist_id):
+    # (tracks, age in seconds) of the last snapshot fetched, without calling
+    # Spotify, or (None, None) when nothing is cached.
+    latest = _playlists.get(f'{playlist_id}:latest')
+    if latest is None:
+        return None, None
+    cached = _playlists.get(f"{playlist_id}:{latest['snapshot_id']}")
+    if cached is None:
+        return None, None
+    return cached['tracks'], time.time() - latest['fetched_at']
+
+def iter_playlist_tracks(sp, playlist_id, partial=True):
+    # Spotify changes snapshot_id on every edit, so a cache entry keyed by it
+    # never goes stale; only the cheap fields-limited request is made per view.
+    # The snapshot check and first page are fetched before this returns, so a
+    # Spotify error is raised here rather than in the middle of a streamed page.
+    ttl = current_app.config['PLAYLIST_CACHE_TTL']
+    snapshot_id = get_playlist_snapshot_id(sp, playlist_id)
+    cached = _playlists.get(f'{playlist_id}:{snapshot_id}')
+    if cached is not None:
+        _mark_latest(playlist_id, snapshot_id, ttl)
+        return iter(cached['tracks'])
+    return _iter_pages(sp, playlist_id, sp.playlist(playlist_id), ttl, partial)
+
+def _iter_pages(sp, playlist_id, playlist, ttl, partial):
+    max_workers = current_app.config['SPOTIFY_PAGE_WORKERS']
+    first_page = playlist['tracks']
+    tracks = _playable(first_page['items'])
+    yield from tracks
+
+    page_size = first_page['limit'] or 100
+    offsets = range(page_size, first_page['total'], page_size)
+    if offsets:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(offsets))) as executor:
+            pages = [
+                executor.submit(_with_context(sp.playlist_items), playlist_id, limit=page_size, offset=offset)
+                for offset in offsets
+            ]
+            for page in pages:
+                try:
+                    items = _playable(page.result()['items'])
+                except (SpotifyException, RateLimitExceeded) as e:
+                    # A streamed page has already started; end the list with
+                    # the pages fetched so far and leave the cache alone.
+                    if not partial:
+                        raise
+                    current_app.logger.warning(f"Stopped streaming playlist {playlist_id}: {str(e)}")
+                    for pending in pages:
+                        pending.cancel()
+                    return
+                tracks.extend(items)
+                yield from items
+
+    _playlists.set(
+        f"{playlist_id}:{playlist['snapshot_id']}",
+        {'snapshot_id': playlist['snapshot_id'], 'tracks': tracks},
+        ttl=ttl
+    )
+    _mark_latest(playlist_id, playlist['snapshot_id'], ttl)
+
+def get_playlist_tracks(sp, playlist_id):
+    return list(iter_playlist_tracks(sp, playlist_id, partial=False))
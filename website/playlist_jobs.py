@@ -0,0 +1,90 @@
+from flask import current_app
+from .cache import LRUCache, get_redis
+from .jobs import enqueue, job_handler
+from .live import publish_event_update
+from .models import db, Event
+from .playlist_cache import get_playlist_tracks
+from .playlist_sync import sync_event
+from .spotify_utils import get_spotify_client_for_user
+import time
+
+SPOTIFY_ADD_ITEMS_BATCH = 100
+
+# Reorder keys this process has already enqueued, so votes after the first in
+# a debounce window skip the job table.
+_reorders = LRUCache(maxsize=1024)
+
+# An event's Spotify jobs share one queue, so the playlist exists before
+# tracks are added to it and a warm-up sees the tracks added before it.
+def _queue(event_id):
+    return f'event:{event_id}'
+
+def _host_client(event):
+    sp = get_spotify_client_for_user(event.host_id)
+    if sp is None:
+        raise RuntimeError(f'Host of event {event.id} has no usable Spotify token')
+    return sp
+
+def request_playlist_create(event, name):
+    return enqueue('playlist.create', {'event_id': event.id, 'name': name},
+                   key=f'event:{event.id}:create_playlist', queue=_queue(event.id))
+
+def request_playlist_add(event_id, song_id, track_id):
+    return enqueue('playlist.add', {'event_id': event_id, 'track_id': track_id},
+                   key=f'event:{event_id}:add:{song_id}', queue=_queue(event_id))
+
+def request_playlist_warm(event_id):
+    # One warm-up per event per interval, however many guests load the page.
+    interval = current_app.config['PLAYLIST_WARM_INTERVAL']
+    return enqueue('playlist.warm', {'event_id': event_id},
+                   key=f'event:{event_id}:warm:{int(time.time() // interval)}', queue=_queue(event_id))
+
+def request_playlist_reorder(event_id):
+    # Changes in the same PLAYLIST_SYNC_DEBOUNCE window share one reorder,
+    # which runs when the window closes. Returns None if this process already
+    # asked for it; otherwise the job, which the caller commits.
+    debounce = current_app.config['PLAYLIST_SYNC_DEBOUNCE']
+    window = int(time.time() // debounce)
+    key = f'event:{event_id}:reorder:{window}'
+    if _reorders.get(key):
+        return None
+    job = enqueue('playlist.reorder', {'event_id': event_id}, key=key, queue=_queue(event_id),
+                  delay=max(0, (window + 1) * debounce - time.time()))
+    _reorders.set(key, True, ttl=debounce)
+    return job
+
+def warm_cache_is_shared():
+    # A worker process only helps page views through a cache they share.
+    return get_redis() is not None or current_app.config['JOBS_IN_PROCESS']
+
+@job_handler('playlist.create')
+def create_playlist(event_id, name):
+    event = db.session.get(Event, event_id)
+    if event is None or event.spotify_playlist_id:
+        return
+    sp = _host_client(event)
+    playlist = sp.user_playlist_create(user=sp.me()['id'], name=name)
+    event.spotify_playlist_id = playlist['id']
+    db.session.commit()
+    publish_event_update(event_id, 'playlist_ready', spotify_playlist_id=playlist['id'])
+
+@job_handler('playlist.add', batch=SPOTIFY_ADD_ITEMS_BATCH)
+def add_tracks(payloads):
+    event = db.session.get(Event, payloads[0]['event_id'])
+    if event is None:
+        return
+    if not event.spotify_playlist_id:
+        raise RuntimeError(f'Event {event.id} has no Spotify playlist yet')
+    uris = list(dict.fromkeys(f"spotify:track:{payload['track_id']}" for payload in payloads))
+    _host_client(event).playlist_add_items(event.spotify_playlist_id, uris)
+
+@job_handler('playlist.warm')
+def warm_playlist(event_id):
+    event = db.session.get(Event, event_id)
+    if event is None or not event.spotify_playlist_id:
+        return
+    get_playlist_tracks(_host_client(event), event.spotify_playlist_id)
+
+@job_handler('playlist.reorder')
+def reorder_playlist(event_id):
+    sync_event(event_id)
@@ -0,0 +1,112 @@
+from flask import current_app
+from bisect import bisect_left
+from .models import db, Event, Song
+from .spotify_utils import get_spotify_client_for_user
+from .vote_engine import ranked_songs
+
+SPOTIFY_PLAYLIST_PAGE = 100
+
+def longest_increasing_subsequence(values):
+    # Indexes of one longest strictly increasing subsequence, O(n log n).
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(values)
+    for i, value in enumerate(values):
+        position = bisect_left(tails, value)
+        if position == len(tails):
+            tails.append(value)
+            tail_indexes.append(i)
+        else:
+            tails[position] = value
+            tail_indexes[position] = i
+        previous[i] = tail_indexes[position - 1] if position else None
+
+    indexes = []
+    i = tail_indexes[-1] if tail_indexes else None
+    while i is not None:
+        indexes.append(i)
+        i = previous[i]
+    return indexes[::-1]
+
+def plan_reorder(current, target):
+    """Return (range_start, insert_before) moves that turn current into target.
+
+    Both are lists of the same items. Items on a longest increasing
+    subsequence of target positions stay put, so len(current) - LIS moves are
+    made, which is the fewest single item moves possible.
+    """
+    slots = {}
+    for position, item in enumerate(target):
+        slots.setdefault(item, []).append(position)
+    order = [slots[item].pop(0) for item in current]
+
+    settled = set(order[i] for i in longest_increasing_subsequence(order))
+    moves = []
+    for position in range(len(order)):
+        if position in settled:
+            continue
+        range_start = order.index(position)
+        insert_before = order.index(position - 1) + 1 if position else 0
+        if insert_before == range_start:
+            settled.add(position)
+            continue
+        moves.append((range_start, insert_before))
+        order.insert(insert_before - (insert_before > range_start), order.pop(range_start))
+        settled.add(position)
+    return moves
+
+def _playlist_track_ids(sp, playlist_id):
+    # Raw positions, including local files (track id None), since reorder
+    # indexes count every item in the playlist.
+    track_ids = []
+    offset = 0
+    while True:
+        page = sp.playlist_items(
+            playlist_id, fields='items(track(id)),total',
+            limit=SPOTIFY_PLAYLIST_PAGE, offset=offset
+        )
+        track_ids.extend((item.get('track') or {}).get('id') for item in page['items'])
+        offset += SPOTIFY_PLAYLIST_PAGE
+        if offset >= page['total'] or not page['items']:
+            return track_ids
+
+def _target_order(event_id, track_ids):
+    ranked = [song_id for song_id, _ in ranked_songs(event_id, count=None)]
+    spotify_ids = dict(db.session.execute(
+        db.select(Song.id, Song.spotify_track_id).where(Song.id.in_(ranked))
+    ).all()) if ranked else {}
+
+    ranks = {}
+    for rank, song_id in enumerate(ranked):
+        ranks.setdefault(spotify_ids.get(song_id), rank)
+
+    # Tracks the queue does not know about (added in Spotify directly, local
+    # files) keep their relative order after the ranked ones.
+    positions = sorted(
+        range(len(track_ids)),
+        key=lambda i: (ranks.get(track_ids[i], len(ranks)), i)
+    )
+    return [track_ids[i] for i in positions]
+
+def sync_event(event_id):
+    # Runs as the playlist.reorder job; errors propagate so the job retries.
+    event = db.session.get(Event, event_id)
+    if event is None or not event.spotify_playlist_id:
+        return 0
+    sp = get_spotify_client_for_user(event.host_id)
+    if sp is None:
+        raise RuntimeError(f'Host of event {event_id} has no usable Spotify token')
+
+    snapshot_id = sp.playlist(event.spotify_playlist_id, fields='snapshot_id')['snapshot_id']
+    track_ids = _playlist_track_ids(sp, event.spotify_playlist_id)
+    moves = plan_reorder(track_ids, _target_order(event_id, track_ids))
+
+    for range_start, insert_before in moves:
+        # Each move is made against the snapshot the previous one returned,
+        # so a concurrent edit fails the sync instead of scrambling it.
+        snapshot_id = sp.playlist_reorder_items(
+            event.spotify_playlist_id, range_start, insert_before, snapshot_id=snapshot_id
+        )['snapshot_id']
+    if moves:
+        current_app.logger.info(f"Reordered playlist for event {event_id} with {len(moves)} move(s)")
+    return len(moves)
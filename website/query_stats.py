@@ -0,0 +1,96 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from collections import Counter
+import time
+
+class QueryStats:
+    def __init__(self, slowest=3):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = []
+        self.statements = Counter()
+        self._keep = slowest
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self.statements[statement] += 1
+        self.slowest.append((elapsed, statement))
+        self.slowest.sort(key=lambda entry: entry[0], reverse=True)
+        del self.slowest[self._keep:]
+
+    def repeated(self):
+        # The statement run most often, which is what an N+1 looks like.
+        return self.statements.most_common(1)[0] if self.statements else (None, 0)
+
+def _shorten(statement, length=200):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= length else statement[:length] + '...'
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    # Background threads have no request to charge the query to.
+    if has_request_context():
+        stats = g.get('query_stats')
+        if stats is not None:
+            stats.record(statement, elapsed)
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute.
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+_listening = False
+
+def init_query_stats(app):
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _listening = True
+
+    @app.before_request
+    def start_query_stats():
+        if app.config['QUERY_STATS_ENABLED']:
+            g.query_stats = QueryStats(app.config['SLOW_QUERY_LOG_COUNT'])
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+
+        timing = f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries"'
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+
+        # Streamed pages keep querying after this point, so the log line is
+        # written once the body has been sent.
+        endpoint, method, path = request.endpoint, request.method, request.path
+        status = response.status_code
+        response.call_on_close(lambda: _log_query_stats(app, stats, endpoint, method, path, status))
+        return response
+
+def _log_query_stats(app, stats, endpoint, method, path, status):
+    slowest_ms = stats.slowest[0][0] * 1000 if stats.slowest else 0.0
+    app.logger.info(
+        f"sql endpoint={endpoint} method={method} path={path} status={status} "
+        f"queries={stats.count} db_ms={stats.total * 1000:.1f} slowest_ms={slowest_ms:.1f}"
+    )
+
+    for elapsed, statement in stats.slowest:
+        if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+            app.logger.warning(f"Slow query on {endpoint} ({elapsed * 1000:.1f}ms): {_shorten(statement)}")
+
+    threshold = app.config['QUERY_COUNT_WARN_THRESHOLD']
+    if threshold and stats.count > threshold:
+        statement, repeats = stats.repeated()
+        app.logger.warning(
+            f"Possible N+1 on {endpoint}: {stats.count} queries (threshold {threshold}), "
+            f"most repeated {repeats}x: {_shorten(statement)}"
+        )
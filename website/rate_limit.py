@@ -0,0 +1,216 @@
+from flask import current_app
+from spotipy.exceptions import SpotifyException
+from .cache import get_redis
+import redis
+import threading
+import time
+
+# Refills the shared bucket from redis server time so every gunicorn worker
+# (and host) agrees on the clock. Returns the seconds the caller must wait
+# before retrying, or 0 when a token was taken.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+BUCKET_KEY = 'drolg:spotify:bucket'
+BLOCKED_KEY = 'drolg:spotify:blocked'
+QUEUE_DEPTH_KEY = 'drolg:spotify:queue_depth'
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+            self.timestamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class SpotifyScheduler:
+    """Global budget for Spotify Web API calls.
+
+    Calls wait for a token from a bucket shared through redis (or a per-worker
+    bucket without it). A 429 blocks every worker for the Retry-After period
+    before the call is retried.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.rate = app.config['SPOTIFY_RATE_LIMIT']
+        self.capacity = app.config['SPOTIFY_RATE_BURST']
+        self.max_wait = app.config['SPOTIFY_MAX_QUEUE_WAIT']
+        self.max_retries = app.config['SPOTIFY_429_RETRIES']
+        self.local_bucket = TokenBucket(self.rate, self.capacity)
+        self._blocked_until = 0
+        self._script = None
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.calls = 0
+        self.waited_calls = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.throttled = 0
+        self.rejected = 0
+
+    def _redis(self):
+        return get_redis(self.app)
+
+    def _take_token(self):
+        client = self._redis()
+        if client is not None:
+            try:
+                if self._script is None:
+                    self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+                return float(self._script(keys=[BUCKET_KEY], args=[self.rate, self.capacity]))
+            except redis.RedisError as e:
+                self.app.logger.warning(f"Redis token bucket unavailable: {str(e)}")
+        return self.local_bucket.take()
+
+    def _blocked_for(self):
+        client = self._redis()
+        if client is not None:
+            try:
+                ttl = client.pttl(BLOCKED_KEY)
+                if ttl and ttl > 0:
+                    return ttl / 1000
+                return 0
+            except redis.RedisError:
+                pass
+        return max(self._blocked_until - time.monotonic(), 0)
+
+    def block(self, seconds):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        client = self._redis()
+        if client is not None:
+            try:
+                ttl = client.pttl(BLOCKED_KEY)
+                if not ttl or ttl < seconds * 1000:
+                    client.set(BLOCKED_KEY, 1, px=int(seconds * 1000))
+            except redis.RedisError:
+                pass
+
+    def _change_depth(self, delta):
+        with self._lock:
+            self.queue_depth += delta
+        client = self._redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                pipe.incrby(QUEUE_DEPTH_KEY, delta)
+                pipe.expire(QUEUE_DEPTH_KEY, 60)
+                pipe.execute()
+            except redis.RedisError:
+                pass
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        queued = False
+        try:
+            while True:
+                wait = self._blocked_for() or self._take_token()
+                if wait <= 0:
+                    break
+                if time.monotonic() + wait > deadline:
+                    with self._lock:
+                        self.rejected += 1
+                    raise RateLimitExceeded(f"Spotify call budget exhausted, retry in {wait:.1f}s", retry_after=wait)
+                if not queued:
+                    queued = True
+                    self._change_depth(1)
+                time.sleep(wait)
+        finally:
+            if queued:
+                self._change_depth(-1)
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.calls += 1
+            if queued:
+                self.waited_calls += 1
+            self.total_wait += waited
+            self.max_wait_seen = max(self.max_wait_seen, waited)
+        return waited
+
+    def call(self, fn, *args, **kwargs):
+        retries = 0
+        while True:
+            self.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status != 429 or retries >= self.max_retries:
+                    raise
+                retries += 1
+                retry_after = _retry_after(e.headers)
+                with self._lock:
+                    self.throttled += 1
+                self.app.logger.warning(f"Spotify returned 429, pausing calls for {retry_after}s")
+                self.block(retry_after)
+
+    def stats(self):
+        global_depth = None
+        client = self._redis()
+        if client is not None:
+            try:
+                global_depth = int(client.get(QUEUE_DEPTH_KEY) or 0)
+            except redis.RedisError:
+                pass
+        return {
+            'queue_depth': self.queue_depth,
+            'global_queue_depth': global_depth,
+            'calls': self.calls,
+            'waited_calls': self.waited_calls,
+            'total_wait_seconds': round(self.total_wait, 3),
+            'avg_wait_seconds': round(self.total_wait / self.calls, 4) if self.calls else 0,
+            'max_wait_seconds': round(self.max_wait_seen, 3),
+            'throttled': self.throttled,
+            'rejected': self.rejected,
+            'blocked_for_seconds': round(self._blocked_for(), 3)
+        }
+
+
+def _retry_after(headers):
+    try:
+        return max(float((headers or {}).get('Retry-After', 1)), 0.1)
+    except (TypeError, ValueError):
+        return 1.0
+
+def get_scheduler(app=None):
+    app = app or current_app._get_current_object()
+    scheduler = app.extensions.get('spotify_scheduler')
+    if scheduler is None:
+        scheduler = app.extensions.setdefault('spotify_scheduler', SpotifyScheduler(app))
+    return scheduler
@@ -0,0 +1,24 @@
+from flask import current_app
+from .cache import Cache
+from .track_cache import remember_tracks
+
+_searches = Cache('search', maxsize=1024)
+
+def normalize_query(query):
+    return ' '.join((query or '').lower().split())
+
+def search_tracks(sp, query, limit=10):
+    normalized = normalize_query(query)
+    if not normalized:
+        return []
+
+    def fetch():
+        tracks = sp.search(q=normalized, type='track', limit=limit)['tracks']['items']
+        remember_tracks(tracks)
+        return tracks
+
+    return _searches.get_or_compute(
+        f'{limit}:{normalized}',
+        fetch,
+        ttl=current_app.config['SEARCH_CACHE_TTL']
+    )
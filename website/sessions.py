@@ -0,0 +1,227 @@
+from datetime import datetime
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from sqlalchemy.exc import IntegrityError
+from .background import ensure_periodic
+from .cache import get_redis
+from .models import db, SessionRecord
+import re
+import secrets
+import redis
+import sqlalchemy as sa
+import threading
+
+# The cookie only carries a random session id; the data lives in redis, or
+# in the session_record table when redis is not configured or unavailable.
+# Nothing is read until the request touches the session, and nothing is
+# written unless it changed. A session id is only kept if the store already
+# has data for it, so a client cannot choose its own id; login and logout
+# move the data to a fresh id with regenerate().
+_SID = re.compile(r'^[A-Za-z0-9_-]{43}$')
+_engine_lock = threading.Lock()
+
+
+def _session_key(sid):
+    return f'drolg:session:{sid}'
+
+
+def _engine(app):
+    # The SQL store has its own small pool. Session rows are then written in
+    # their own transaction, outside the request's db.session, and a request
+    # waiting for a session connection never waits on the pool it already
+    # holds a connection from.
+    engine = app.extensions.get('drolg_session_engine')
+    if engine is None:
+        with _engine_lock:
+            engine = app.extensions.get('drolg_session_engine')
+            if engine is None:
+                with app.app_context():
+                    main = db.engine
+                if main.url.get_backend_name() == 'sqlite' and main.url.database in (None, '', ':memory:'):
+                    # An in-memory database only exists on the app's own connection.
+                    engine = main
+                else:
+                    engine = sa.create_engine(
+                        main.url,
+                        pool_size=app.config['SESSION_DB_POOL_SIZE'],
+                        max_overflow=0,
+                        pool_pre_ping=True
+                    )
+                app.extensions['drolg_session_engine'] = engine
+    return engine
+
+
+def _new_sid():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSession(SessionMixin):
+    def __init__(self, sid, loader=None):
+        self.sid = sid
+        self.new = loader is None
+        self.modified = False
+        self.accessed = False
+        self.replaced_sid = None
+        self._loader = loader
+        self._data = {} if loader is None else None
+
+    @property
+    def data(self):
+        self.accessed = True
+        if self._data is None:
+            self._data = self._loader()
+            if self._data is None:
+                # Unknown or expired id: never adopt it.
+                self._data = {}
+                self.sid = _new_sid()
+                self.new = True
+        return self._data
+
+    def regenerate(self):
+        # Called on login and logout so an id seen before either stops working.
+        data = self.data
+        if not self.new and self.replaced_sid is None:
+            self.replaced_sid = self.sid
+        self.sid = _new_sid()
+        self.new = True
+        self.modified = bool(data) or self.replaced_sid is not None
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def setdefault(self, key, default=None):
+        if key not in self.data:
+            self[key] = default
+        return self.data[key]
+
+    def clear(self):
+        if self.data:
+            self.data.clear()
+            self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not _SID.match(sid):
+            return ServerSession(_new_sid())
+        return ServerSession(sid, loader=lambda: self._load(app, sid))
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session.modified:
+            return
+
+        if session.replaced_sid is not None:
+            self._delete(app, session.replaced_sid)
+
+        if not session:
+            if not session.new:
+                self._delete(app, session.sid)
+            if not session.new or session.replaced_sid is not None:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        self._store(app, session.sid, self.serializer.dumps(dict(session)))
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def _ttl(self, app):
+        return int(app.permanent_session_lifetime.total_seconds())
+
+    def _load(self, app, sid):
+        client = get_redis(app)
+        if client is not None:
+            try:
+                raw = client.get(_session_key(sid))
+                if raw is not None:
+                    return self.serializer.loads(raw)
+            except redis.RedisError as e:
+                app.logger.warning(f"Redis session store unavailable: {str(e)}")
+        # Also reached on a redis miss, for sessions written during an outage.
+        table = SessionRecord.__table__
+        with _engine(app).connect() as conn:
+            raw = conn.execute(
+                db.select(table.c.data).where(table.c.id == sid, table.c.expiry > datetime.utcnow())
+            ).scalar()
+        return self.serializer.loads(raw) if raw is not None else None
+
+    def _store(self, app, sid, raw):
+        client = get_redis(app)
+        if client is not None:
+            try:
+                client.set(_session_key(sid), raw, ex=self._ttl(app))
+                return
+            except redis.RedisError as e:
+                app.logger.warning(f"Redis session store unavailable: {str(e)}")
+
+        table = SessionRecord.__table__
+        expiry = datetime.utcnow() + app.permanent_session_lifetime
+        with _engine(app).begin() as conn:
+            updated = conn.execute(
+                table.update().where(table.c.id == sid).values(data=raw, expiry=expiry)
+            ).rowcount
+            if not updated:
+                try:
+                    with conn.begin_nested():
+                        conn.execute(table.insert().values(id=sid, data=raw, expiry=expiry))
+                except IntegrityError:
+                    conn.execute(table.update().where(table.c.id == sid).values(data=raw, expiry=expiry))
+        ensure_periodic(app, 'session-cleanup', app.config['SESSION_CLEANUP_INTERVAL'], delete_expired_sessions)
+
+    def _delete(self, app, sid):
+        client = get_redis(app)
+        if client is not None:
+            try:
+                client.delete(_session_key(sid))
+            except redis.RedisError as e:
+                app.logger.warning(f"Redis session store unavailable: {str(e)}")
+        # Always cleared in SQL too, so a logout cannot be undone by a copy
+        # written there while redis was down.
+        table = SessionRecord.__table__
+        with _engine(app).begin() as conn:
+            conn.execute(table.delete().where(table.c.id == sid))
+
+
+def delete_expired_sessions(app):
+    table = SessionRecord.__table__
+    with _engine(app).begin() as conn:
+        conn.execute(table.delete().where(table.c.expiry <= datetime.utcnow()))
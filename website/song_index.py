@@ -0,0 +1,115 @@
+from flask import current_app
+from sqlalchemy import DDL, and_, event, func, or_, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from .models import db, Song
+import re
+
+# SQLite keeps an external-content FTS5 table in sync with song through
+# triggers. The prefix indexes make 2 and 3 letter typeahead prefixes cheap.
+SQLITE_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS song_fts USING fts5("
+    "title, artist, content='song', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS song_fts_ai AFTER INSERT ON song BEGIN "
+    "INSERT INTO song_fts(rowid, title, artist) VALUES (new.id, new.title, new.artist); END",
+    "CREATE TRIGGER IF NOT EXISTS song_fts_ad AFTER DELETE ON song BEGIN "
+    "INSERT INTO song_fts(song_fts, rowid, title, artist) VALUES ('delete', old.id, old.title, old.artist); END",
+    "CREATE TRIGGER IF NOT EXISTS song_fts_au AFTER UPDATE OF title, artist ON song BEGIN "
+    "INSERT INTO song_fts(song_fts, rowid, title, artist) VALUES ('delete', old.id, old.title, old.artist); "
+    "INSERT INTO song_fts(rowid, title, artist) VALUES (new.id, new.title, new.artist); END",
+]
+
+POSTGRES_INDEX_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_song_title_trgm ON song USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_song_artist_trgm ON song USING gin (artist gin_trgm_ops)",
+]
+
+for statement in SQLITE_INDEX_DDL:
+    event.listen(Song.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_INDEX_DDL:
+    event.listen(Song.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+def _terms(query):
+    return _TERM.findall((query or '').lower())
+
+def _as_track(row):
+    return {
+        'id': row.spotify_track_id,
+        'name': row.title,
+        'artists': [{'name': name} for name in row.artist.split(', ')],
+        'uri': f'spotify:track:{row.spotify_track_id}',
+        'source': 'local'
+    }
+
+def _unique(rows, limit):
+    seen = set()
+    tracks = []
+    for row in rows:
+        if row.spotify_track_id in seen:
+            continue
+        seen.add(row.spotify_track_id)
+        tracks.append(_as_track(row))
+        if len(tracks) == limit:
+            break
+    return tracks
+
+def _search_sqlite(terms, limit):
+    match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+    return db.session.execute(
+        text(
+            "SELECT song.spotify_track_id, song.title, song.artist FROM song_fts "
+            "JOIN song ON song.id = song_fts.rowid "
+            "WHERE song_fts MATCH :match ORDER BY song_fts.rank LIMIT :limit"
+        ),
+        {'match': match, 'limit': limit * 3}
+    ).all()
+
+def _search_like(terms, query, limit):
+    conditions = []
+    for term in terms:
+        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conditions.append(or_(Song.title.ilike(pattern, escape='\\'), Song.artist.ilike(pattern, escape='\\')))
+
+    stmt = db.select(Song.spotify_track_id, Song.title, Song.artist).where(and_(*conditions))
+    if db.engine.dialect.name == 'postgresql':
+        # ILIKE '%term%' is answered from the pg_trgm GIN indexes.
+        stmt = stmt.order_by(func.greatest(
+            func.similarity(Song.title, query), func.similarity(Song.artist, query)
+        ).desc())
+    else:
+        stmt = stmt.order_by(Song.id.desc())
+    return db.session.execute(stmt.limit(limit * 3)).all()
+
+def search_local_tracks(query, limit=10):
+    terms = _terms(query)
+    if not terms:
+        return []
+
+    if db.engine.dialect.name == 'sqlite':
+        try:
+            return _unique(_search_sqlite(terms, limit), limit)
+        except OperationalError as e:
+            # Databases created before the index existed fall back to LIKE.
+            db.session.rollback()
+            current_app.logger.warning(f"song_fts unavailable, using LIKE search: {str(e)}")
+
+    try:
+        return _unique(_search_like(terms, ' '.join(terms), limit), limit)
+    except ProgrammingError as e:
+        db.session.rollback()
+        current_app.logger.warning(f"Local song search failed: {str(e)}")
+        return []
+
+def merge_tracks(local_tracks, remote_tracks, limit):
+    seen = {track['id'] for track in local_tracks}
+    merged = list(local_tracks)
+    for track in remote_tracks:
+        if len(merged) == limit:
+            break
+        if track['id'] not in seen:
+            seen.add(track['id'])
+            merged.append(track)
+    return merged
@@ -1,53 +1,158 @@
-from flask import current_app, session
+from flask import current_app
+from flask_login import current_user
 import spotipy
 from spotipy.oauth2 import SpotifyOAuth
-from .models import db, User
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .cache import SingleFlight
+from .metrics import record_spotify_response
+from .rate_limit import get_scheduler
+from .token_manager import get_access_token
+import json
+import os
+import requests
+import threading
 
-def create_spotify_oauth():
-    return SpotifyOAuth(
-        client_id=current_app.config['SPOTIPY_CLIENT_ID'],
-        client_secret=current_app.config['SPOTIPY_CLIENT_SECRET'],
-        redirect_uri=current_app.config['SPOTIPY_REDIRECT_URI'],
-        scope="user-library-read playlist-modify-public playlist-modify-private",
-        cache_handler=None,
-        show_dialog=True
+SPOTIFY_SCOPE = "user-library-read playlist-modify-public playlist-modify-private"
+
+_http_sessions = {}
+_http_lock = threading.Lock()
+_in_flight = SingleFlight()
+
+
+class SharedSession(requests.Session):
+    # spotipy closes its session from Spotify.__del__ and SpotifyAuthBase.__del__,
+    # which would drop the pooled connections every time a client is collected.
+    def close(self):
+        pass
+
+    def shutdown(self):
+        super().close()
+
+
+class SpotifyClient(spotipy.Spotify):
+    # Every Web API request spotipy makes goes through _internal_call, so this
+    # is the one place that enforces the shared call budget.
+    def __init__(self, *args, scheduler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    def _internal_call(self, method, url, payload, params):
+        call = super()._internal_call
+        if method != 'GET':
+            return self.scheduler.call(call, method, url, payload, params)
+
+        key = (
+            url,
+            json.dumps(params, sort_keys=True, default=str),
+            self._auth_headers().get('Authorization')
+        )
+        return _in_flight.do(key, lambda: self.scheduler.call(call, method, url, payload, params))
+
+
+def _build_http_session(config):
+    http = SharedSession()
+    retry = Retry(
+        total=spotipy.Spotify.max_retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=spotipy.Spotify.max_retries,
+        backoff_factor=0.3,
+        # 429s are left to the scheduler so Retry-After pauses every worker.
+        status_forcelist=[code for code in spotipy.Spotify.default_retry_codes if code != 429],
+        respect_retry_after_header=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config['SPOTIFY_POOL_CONNECTIONS'],
+        pool_maxsize=config['SPOTIFY_POOL_SIZE'],
+        max_retries=retry
     )
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+    http.hooks['response'].append(record_spotify_response)
+    return http
 
-def get_spotify_client():
-    cache_handler = spotipy.cache_handler.FlaskSessionCacheHandler(session)
-    auth_manager = SpotifyOAuth(
+def get_http_session():
+    # Keyed by pid so gunicorn workers never share sockets inherited across fork.
+    pid = os.getpid()
+    http = _http_sessions.get(pid)
+    if http is None:
+        with _http_lock:
+            http = _http_sessions.get(pid)
+            if http is None:
+                http = _build_http_session(current_app.config)
+                _http_sessions.clear()
+                _http_sessions[pid] = http
+    return http
+
+def get_requests_timeout():
+    return (current_app.config['SPOTIFY_CONNECT_TIMEOUT'], current_app.config['SPOTIFY_READ_TIMEOUT'])
+
+def get_pool_stats():
+    http = _http_sessions.get(os.getpid())
+    stats = {'pid': os.getpid(), 'pools': 0, 'connections_opened': 0, 'requests': 0, 'connections_reused': 0}
+    if http is None:
+        return stats
+
+    seen = set()
+    for adapter in http.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['pools'] += 1
+            stats['connections_opened'] += pool.num_connections
+            stats['requests'] += pool.num_requests
+    stats['connections_reused'] = max(stats['requests'] - stats['connections_opened'], 0)
+    return stats
+
+def create_spotify_oauth(cache_handler=None):
+    # Without a handler spotipy falls back to the shared .cache file, which
+    # would hand one user's token to the next caller in the same worker.
+    if cache_handler is None:
+        cache_handler = spotipy.cache_handler.MemoryCacheHandler()
+    oauth = SpotifyOAuth(
         client_id=current_app.config['SPOTIPY_CLIENT_ID'],
         client_secret=current_app.config['SPOTIPY_CLIENT_SECRET'],
         redirect_uri=current_app.config['SPOTIPY_REDIRECT_URI'],
-        scope="playlist-modify-public playlist-modify-private",
+        scope=SPOTIFY_SCOPE,
         cache_handler=cache_handler,
-        show_dialog=True
+        show_dialog=True,
+        requests_session=get_http_session(),
+        requests_timeout=get_requests_timeout()
     )
+    accounts_url = current_app.config['SPOTIFY_ACCOUNTS_URL'].rstrip('/')
+    oauth.OAUTH_AUTHORIZE_URL = f'{accounts_url}/authorize'
+    oauth.OAUTH_TOKEN_URL = f'{accounts_url}/api/token'
+    return oauth
 
-    if not auth_manager.validate_token(cache_handler.get_cached_token()):
-        return None
-
-    return spotipy.Spotify(auth_manager=auth_manager)
-
-
-def is_token_expired(token_info):
-    now = int(time.time())
-    return token_info['expires_at'] - now < 60
+def create_spotify_client(auth=None, auth_manager=None):
+    client = SpotifyClient(
+        auth=auth,
+        auth_manager=auth_manager,
+        requests_session=get_http_session(),
+        requests_timeout=get_requests_timeout(),
+        scheduler=get_scheduler()
+    )
+    client.prefix = current_app.config['SPOTIFY_API_URL']
+    return client
 
-def refresh_token(refresh_token):
-    sp_oauth = create_spotify_oauth()
-    token_info = sp_oauth.refresh_access_token(refresh_token)
-    
-    user = User.query.get(session.get('user_id'))
-    if user:
-        user.spotify_token = token_info['access_token']
-        user.refresh_token = token_info['refresh_token']
-        user.token_expiry = int(token_info['expires_at'])
-        db.session.commit()
+def get_spotify_client():
+    if not current_user.is_authenticated:
+        return None
+    return get_spotify_client_for_user(current_user.id)
 
-    return token_info
+def get_spotify_client_for_user(user_id):
+    access_token = get_access_token(user_id)
+    if access_token is None:
+        return None
+    return create_spotify_client(auth=access_token)
 
 def get_spotify_user_info(access_token):
-    sp = spotipy.Spotify(auth=access_token)
+    sp = create_spotify_client(auth=access_token)
     return sp.me()
\ No newline at end of file
@@ -0,0 +1,185 @@
+from flask import current_app
+from .background import ensure_periodic
+from .cache import SingleFlight, get_redis
+from .models import db, User
+import json
+import os
+import redis
+import threading
+import time
+
+# The User row is the store of record for Spotify tokens and redis is a
+# read-through copy every worker shares. A background thread refreshes the
+# tokens of recently active users before they expire, so requests normally
+# just read a valid token; a request only refreshes inline when that thread
+# has fallen behind, and then concurrent callers share one refresh.
+ACTIVE_USERS_KEY = 'drolg:spotify_tokens:active'
+
+_refreshes = SingleFlight()
+_local_active = {}
+_local_lock = threading.Lock()
+
+def _token_key(user_id):
+    return f'drolg:spotify_tokens:{user_id}'
+
+def _from_user(user):
+    return {
+        'access_token': user.spotify_token,
+        'refresh_token': user.refresh_token,
+        'expires_at': user.token_expiry or 0,
+        'token_type': 'Bearer'
+    }
+
+def _cache_token(user_id, token_info):
+    client = get_redis()
+    ttl = int(token_info['expires_at'] - time.time())
+    if client is None or ttl <= 0:
+        return
+    try:
+        client.set(_token_key(user_id), json.dumps(token_info), ex=ttl)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Redis token store unavailable: {str(e)}")
+
+def _load_from_db(user_id):
+    user = db.session.execute(
+        db.select(User).where(User.id == user_id).execution_options(populate_existing=True)
+    ).scalar()
+    if user is None or not user.refresh_token:
+        return None
+    return _from_user(user)
+
+def load_token(user_id):
+    client = get_redis()
+    if client is not None:
+        try:
+            cached = client.get(_token_key(user_id))
+            if cached:
+                return json.loads(cached)
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Redis token store unavailable: {str(e)}")
+
+    token_info = _load_from_db(user_id)
+    if token_info is not None:
+        _cache_token(user_id, token_info)
+    return token_info
+
+def save_token(user_id, token_info):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    user.spotify_token = token_info['access_token']
+    user.refresh_token = token_info.get('refresh_token') or user.refresh_token
+    user.token_expiry = int(token_info['expires_at'])
+    db.session.commit()
+
+    token_info = _from_user(user)
+    _cache_token(user_id, token_info)
+    return token_info
+
+def _expires_within(token_info, seconds):
+    return token_info['expires_at'] - time.time() < seconds
+
+def _refresh(user_id, force):
+    # Imported here because spotify_utils builds its clients from this module.
+    from .spotify_utils import create_spotify_oauth
+
+    client = get_redis()
+    lock_key = _token_key(user_id) + ':lock'
+    locked = False
+    if client is not None:
+        try:
+            locked = client.set(lock_key, os.getpid(), nx=True, px=10000)
+            if not locked:
+                # Another worker is refreshing; use its token once it lands.
+                deadline = time.monotonic() + 10
+                while time.monotonic() < deadline:
+                    cached = client.get(_token_key(user_id))
+                    if cached and not _expires_within(json.loads(cached), current_app.config['TOKEN_MIN_VALIDITY']):
+                        return json.loads(cached)
+                    time.sleep(0.05)
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Redis token lock unavailable: {str(e)}")
+
+    try:
+        token_info = _load_from_db(user_id)
+        if token_info is None:
+            return None
+        if not force and not _expires_within(token_info, current_app.config['TOKEN_REFRESH_AHEAD']):
+            # Refreshed by someone else since the caller looked.
+            _cache_token(user_id, token_info)
+            return token_info
+
+        refreshed = create_spotify_oauth().refresh_access_token(token_info['refresh_token'])
+        return save_token(user_id, refreshed)
+    finally:
+        if locked:
+            try:
+                client.delete(lock_key)
+            except redis.RedisError:
+                pass
+
+def refresh_token(user_id, force=False):
+    return _refreshes.do(user_id, lambda: _refresh(user_id, force))
+
+def _mark_active(user_id):
+    now = time.time()
+    client = get_redis()
+    if client is not None:
+        try:
+            client.zadd(ACTIVE_USERS_KEY, {user_id: now})
+            return
+        except redis.RedisError:
+            pass
+    with _local_lock:
+        _local_active[user_id] = now
+
+def _active_users(app):
+    since = time.time() - app.config['TOKEN_ACTIVE_WINDOW']
+    users = set()
+    client = get_redis(app)
+    if client is not None:
+        try:
+            client.zremrangebyscore(ACTIVE_USERS_KEY, '-inf', since)
+            users.update(int(user_id) for user_id in client.zrange(ACTIVE_USERS_KEY, 0, -1))
+        except redis.RedisError as e:
+            app.logger.warning(f"Redis token store unavailable: {str(e)}")
+    with _local_lock:
+        for user_id, last_seen in list(_local_active.items()):
+            if last_seen < since:
+                del _local_active[user_id]
+            else:
+                users.add(user_id)
+    return users
+
+def get_access_token(user_id):
+    token_info = load_token(user_id)
+    if token_info is None:
+        return None
+
+    _mark_active(user_id)
+    _ensure_refresher()
+    if _expires_within(token_info, current_app.config['TOKEN_MIN_VALIDITY']):
+        try:
+            token_info = refresh_token(user_id)
+        except Exception as e:
+            current_app.logger.error(f"Failed to refresh Spotify token for user {user_id}: {str(e)}")
+            return None
+    return token_info['access_token'] if token_info else None
+
+def refresh_expiring_tokens(app):
+    for user_id in _active_users(app):
+        token_info = load_token(user_id)
+        if token_info is None or not _expires_within(token_info, app.config['TOKEN_REFRESH_AHEAD']):
+            continue
+        try:
+            refresh_token(user_id)
+        except Exception as e:
+            app.logger.error(f"Failed to refresh Spotify token for user {user_id}: {str(e)}")
+
+def _ensure_refresher():
+    ensure_periodic(
+        current_app._get_current_object(),
+        'token-refresher',
+        current_app.config['TOKEN_REFRESH_INTERVAL'],
+        refresh_expiring_tokens
+    )
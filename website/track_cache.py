@@ -0,0 +1,70 @@
+from flask import current_app
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime
+from .models import db, Track
+
+SPOTIFY_TRACKS_BATCH = 50
+
+def _track_row(track):
+    return {
+        'spotify_track_id': track['id'],
+        'title': track['name'][:150],
+        'artist': ', '.join(artist['name'] for artist in track['artists'])[:150],
+        'album': (track.get('album') or {}).get('name', '')[:150] or None,
+        'duration_ms': track.get('duration_ms'),
+        'updated_at': datetime.utcnow()
+    }
+
+def remember_tracks(tracks):
+    rows = {}
+    for track in tracks:
+        if track and track.get('id') and track.get('source') != 'local':
+            rows[track['id']] = _track_row(track)
+    if not rows:
+        return
+
+    # Written in a transaction of its own: a search or an add calls this
+    # mid-request, and must not commit whatever that request has pending.
+    table = Track.__table__
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as conn:
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite_insert if dialect == 'sqlite' else postgresql_insert
+            stmt = insert(table).values(list(rows.values()))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.spotify_track_id],
+                set_={column: stmt.excluded[column] for column in ('title', 'artist', 'album', 'duration_ms', 'updated_at')}
+            )
+            conn.execute(stmt)
+        else:
+            for row in rows.values():
+                updated = conn.execute(
+                    table.update().where(table.c.spotify_track_id == row['spotify_track_id']).values(**row)
+                ).rowcount
+                if not updated:
+                    conn.execute(table.insert().values(**row))
+
+def get_tracks(track_ids, sp=None):
+    track_ids = list(dict.fromkeys(track_ids))
+    found = {
+        track.spotify_track_id: track
+        for track in Track.query.filter(Track.spotify_track_id.in_(track_ids)).all()
+    } if track_ids else {}
+
+    missing = [track_id for track_id in track_ids if track_id not in found]
+    if missing and sp is not None:
+        fetched = []
+        for start in range(0, len(missing), SPOTIFY_TRACKS_BATCH):
+            fetched.extend(sp.tracks(missing[start:start + SPOTIFY_TRACKS_BATCH])['tracks'])
+        remember_tracks(fetched)
+        current_app.logger.info(f"Fetched {len(missing)} track(s) missing from the metadata cache")
+        found.update({
+            track.spotify_track_id: track
+            for track in Track.query.filter(Track.spotify_track_id.in_(missing)).all()
+        })
+
+    return found
+
+def get_track(track_id, sp=None):
+    return get_tracks([track_id], sp).get(track_id)
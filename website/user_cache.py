@@ -0,0 +1,40 @@
+from flask import current_app
+from flask_login import UserMixin
+from .cache import Cache
+from .models import db, User
+
+_users = Cache('user', maxsize=4096)
+
+# Only what templates and permission checks read; tokens and the password
+# hash never leave the users table.
+SNAPSHOT_FIELDS = ('id', 'username', 'email', 'spotify_id')
+
+
+class UserSnapshot(UserMixin):
+    """current_user for authenticated requests, loaded without a users query.
+
+    Code that changes a user loads the User row itself and calls
+    invalidate_user() once it has committed.
+    """
+
+    def __init__(self, id, username, email, spotify_id=None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.spotify_id = spotify_id
+
+
+def load_user_snapshot(user_id):
+    snapshot = _users.get(user_id)
+    if snapshot is None:
+        row = db.session.execute(
+            db.select(*(getattr(User, field) for field in SNAPSHOT_FIELDS)).where(User.id == user_id)
+        ).first()
+        if row is None:
+            return None
+        snapshot = dict(row._mapping)
+        _users.set(user_id, snapshot, ttl=current_app.config['USER_CACHE_TTL'])
+    return UserSnapshot(**snapshot)
+
+def invalidate_user(user_id):
+    _users.delete(user_id)
@@ -1,13 +1,39 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, get_flashed_messages, jsonify, current_app, Response, stream_template, stream_with_context
 from flask_login import login_required, current_user
-from .models import db, User, Event, Playlist, Song, Vote, Mood
-from .spotify_utils import get_spotify_client
+from spotipy.exceptions import SpotifyException
+from .models import db, User, Event, Playlist, Song, Vote, Mood, user_event
+from .event_queries import hosted_events, joined_events, event_for_view, is_attendee, can_access_event
+from .spotify_utils import get_spotify_client, get_pool_stats
+from .playlist_cache import iter_playlist_tracks, cached_playlist_tracks
+from .search_cache import search_tracks
+from .song_index import search_local_tracks, merge_tracks
+from .track_cache import get_track
+from .playlist_jobs import request_playlist_create, request_playlist_add, request_playlist_reorder, request_playlist_warm, warm_cache_is_shared
+from .rate_limit import get_scheduler, RateLimitExceeded
+from .vote_engine import apply_votes, get_event_tallies, register_song, wilson_score
+from .play_queue import top_k, next_up, rank_of
+from .live import publish_event_update, stream_event_updates
+from .metrics import spotify_metrics
+from .user_cache import invalidate_user
 from datetime import datetime
+import math
 import random
 import string
 
 views = Blueprint('views', __name__)
 
+SPOTIFY_BUSY = 'Spotify is busy, try again shortly.'
+
+@views.app_errorhandler(RateLimitExceeded)
+def spotify_busy(e):
+    # Views fall back to local data where they can; anything that still runs
+    # out of Spotify budget gets a 503 or a flash instead of a 500.
+    retry_after = str(math.ceil(e.retry_after or 1))
+    if request.path.startswith('/api/') or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'error': SPOTIFY_BUSY}), 503, {'Retry-After': retry_after}
+    flash(SPOTIFY_BUSY, 'warning')
+    return redirect(request.referrer or url_for('views.dashboard'))
+
 @views.route('/')
 def index():
     return render_template('index.html')
@@ -15,9 +41,20 @@ def index():
 @views.route('/dashboard')
 @login_required
 def dashboard():
-    hosted_events = Event.query.filter_by(host_id=current_user.id).all()
-    joined_events = current_user.joined_events
-    return render_template('dashboard.html', hosted_events=hosted_events, joined_events=joined_events)
+    return render_template(
+        'dashboard.html',
+        hosted_events=hosted_events(current_user.id),
+        joined_events=joined_events(current_user.id)
+    )
+
+@views.route('/events')
+@login_required
+def events():
+    return render_template(
+        'events.html',
+        hosted_events=hosted_events(current_user.id),
+        attending_events=joined_events(current_user.id)
+    )
 
 
 @views.route('/create_event', methods=['GET', 'POST'])
@@ -36,6 +73,17 @@ def create_event():
             flash('Failed to connect to Spotify. Please check your Spotify connection.', 'danger')
             return redirect(url_for('views.create_event'))
 
+        spotify_playlist_id = ''
+        if playlist_option != 'new':
+            # An existing playlist is checked now, so a bad id is reported on
+            # the form rather than breaking the event page later.
+            try:
+                spotify_playlist_id = sp.playlist(request.form.get('existing_playlist_id') or '', fields='id')['id']
+            except SpotifyException as e:
+                current_app.logger.warning(f"Rejected playlist for new event: {str(e)}")
+                flash('That Spotify playlist could not be found. Please choose another.', 'danger')
+                return redirect(url_for('views.create_event'))
+
         try:
             # Find or create the Mood
             mood = Mood.query.filter_by(name=mood_name).first()
@@ -44,13 +92,8 @@ def create_event():
                 db.session.add(mood)
                 db.session.commit()
 
-            if playlist_option == 'new':
-                playlist_name = request.form.get('new_playlist_name')
-                spotify_playlist = sp.user_playlist_create(user=sp.me()['id'], name=playlist_name)
-            else:
-                existing_playlist_id = request.form.get('existing_playlist_id')
-                spotify_playlist = sp.playlist(existing_playlist_id)
-
+            # A new playlist is created on Spotify by the job worker; the
+            # event page shows it once it exists.
             event = Event(
                 title=title,
                 description=description,
@@ -58,9 +101,14 @@ def create_event():
                 end_time=end_time,
                 mood_id=mood.id,
                 host_id=current_user.id,
-                spotify_playlist_id=spotify_playlist['id']
+                spotify_playlist_id=spotify_playlist_id,
+                invite_code=''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
             )
+            event.calculate_duration()
             db.session.add(event)
+            db.session.flush()
+            if playlist_option == 'new':
+                request_playlist_create(event, request.form.get('new_playlist_name'))
             db.session.commit()
 
             flash('Event created successfully!', 'success')
@@ -84,20 +132,141 @@ def create_event():
 @views.route('/event/<int:event_id>')
 @login_required
 def event(event_id):
-    event = Event.query.get_or_404(event_id)
-    if event.host_id != current_user.id and current_user not in event.attendees:
+    event = event_for_view(event_id)
+    if not can_access_event(event, current_user.id):
         flash('You do not have permission to view this event.', 'danger')
         return redirect(url_for('views.dashboard'))
     
-    sp = get_spotify_client()
-    if sp and event.spotify_playlist_id:
-        playlist = sp.playlist(event.spotify_playlist_id)
-        tracks = playlist['tracks']['items']
+    tracks = []
+    if not event.spotify_playlist_id:
+        flash('The Spotify playlist for this event is still being created.', 'info')
     else:
-        tracks = []
-        flash('Unable to fetch playlist tracks. Please check your Spotify connection.', 'warning')
-    
-    return render_template('event.html', event=event, tracks=tracks)
+        # Pages are served from the cached playlist and a job refreshes it in
+        # the background; Spotify is only called inline when nothing is cached.
+        cached, age = cached_playlist_tracks(event.spotify_playlist_id)
+        if cached is not None and (age < current_app.config['PLAYLIST_WARM_INTERVAL'] or warm_cache_is_shared()):
+            tracks = cached
+            if age >= current_app.config['PLAYLIST_WARM_INTERVAL']:
+                request_playlist_warm(event.id)
+                db.session.commit()
+        else:
+            sp = get_spotify_client()
+            if sp:
+                # Raises before the response starts; later pages that fail
+                # just end the streamed list.
+                try:
+                    tracks = iter_playlist_tracks(sp, event.spotify_playlist_id)
+                except RateLimitExceeded:
+                    flash(SPOTIFY_BUSY, 'warning')
+                    tracks = cached or []
+                except SpotifyException as e:
+                    current_app.logger.warning(f"Error fetching playlist {event.spotify_playlist_id}: {str(e)}")
+                    flash('Unable to fetch playlist tracks. Please try again shortly.', 'warning')
+                    tracks = cached or []
+            else:
+                flash('Unable to fetch playlist tracks. Please check your Spotify connection.', 'warning')
+
+    song_tallies = get_event_tallies(event.id)
+    vote_counts = {}
+    for song_id, spotify_track_id in db.session.execute(
+        db.select(Song.id, Song.spotify_track_id).join(Playlist).where(Playlist.event_id == event.id)
+    ):
+        upvotes, downvotes = vote_counts.get(spotify_track_id, (0, 0))
+        song_upvotes, song_downvotes = song_tallies.get(song_id, (0, 0))
+        vote_counts[spotify_track_id] = (upvotes + song_upvotes, downvotes + song_downvotes)
+
+    up_next = top_k(event.id, current_app.config['PLAY_QUEUE_PAGE_SIZE'])
+
+    # stream_template runs under stream_with_context, so the page header and
+    # first 100 tracks go out while later playlist pages are still being fetched.
+    # The session is saved before the body streams, so flashes are popped here.
+    return Response(stream_template(
+        'view_event.html', event=event, tracks=tracks, vote_counts=vote_counts, up_next=up_next,
+        flashed_messages=get_flashed_messages(with_categories=True)
+    ))
+
+@views.route('/event/<int:event_id>/edit', methods=['GET', 'POST'])
+@login_required
+def edit_event(event_id):
+    event = Event.query.get_or_404(event_id)
+    if event.host_id != current_user.id:
+        flash('Only the host can edit this event.', 'danger')
+        return redirect(url_for('views.event', event_id=event.id))
+
+    if request.method == 'POST':
+        event.title = request.form.get('title')
+        event.description = request.form.get('description')
+        event.date_event = datetime.strptime(request.form.get('date_event'), '%Y-%m-%dT%H:%M')
+        event.end_time = datetime.strptime(request.form.get('end_time'), '%Y-%m-%dT%H:%M')
+        event.mood_id = request.form.get('mood_id', type=int)
+        event.calculate_duration()
+        db.session.commit()
+        flash('Event updated successfully!', 'success')
+        return redirect(url_for('views.event', event_id=event.id))
+
+    return render_template('edit_event.html', event=event, mood_options=Mood.query.order_by(Mood.name).all())
+
+@views.route('/event/<int:event_id>/delete', methods=['POST'])
+@login_required
+def delete_event(event_id):
+    event = Event.query.get_or_404(event_id)
+    if event.host_id != current_user.id:
+        flash('Only the host can delete this event.', 'danger')
+        return redirect(url_for('views.event', event_id=event.id))
+
+    # Bulk deletes, children first. The attendee rows go with the event and
+    # the Spotify playlist is left to the host.
+    playlist_ids = db.select(Playlist.id).where(Playlist.event_id == event.id)
+    db.session.execute(db.delete(Vote).where(Vote.event_id == event.id))
+    db.session.execute(db.delete(Song).where(Song.playlist_id.in_(playlist_ids)))
+    db.session.execute(db.delete(Playlist).where(Playlist.event_id == event.id))
+    db.session.delete(event)
+    db.session.commit()
+    flash('Event deleted.', 'info')
+    return redirect(url_for('views.dashboard'))
+
+@views.route('/api/event/<int:event_id>/queue')
+@login_required
+def event_queue(event_id):
+    event = Event.query.get_or_404(event_id)
+    if not can_access_event(event, current_user.id):
+        return jsonify({'error': 'Not authorized'}), 403
+
+    limit = min(request.args.get('limit', current_app.config['PLAY_QUEUE_PAGE_SIZE'], type=int), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    return jsonify({
+        'event_id': event.id,
+        'next_up': next_up(event.id),
+        'songs': top_k(event.id, limit, start=offset)
+    })
+
+@views.route('/api/event/<int:event_id>/queue/<int:song_id>')
+@login_required
+def event_queue_rank(event_id, song_id):
+    event = Event.query.get_or_404(event_id)
+    if not can_access_event(event, current_user.id):
+        return jsonify({'error': 'Not authorized'}), 403
+
+    rank = rank_of(event.id, song_id)
+    if rank is None:
+        return jsonify({'error': 'Song is not in this event'}), 404
+    return jsonify({'event_id': event.id, 'song_id': song_id, 'rank': rank})
+
+@views.route('/event/<int:event_id>/stream')
+@login_required
+def event_stream(event_id):
+    event = Event.query.get_or_404(event_id)
+    if not can_access_event(event, current_user.id):
+        return jsonify({'error': 'Not authorized'}), 403
+
+    # Nothing below touches the database; give the connection back before
+    # the long-lived stream starts.
+    db.session.close()
+    return Response(
+        stream_with_context(stream_event_updates(event_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @views.route('/join_event', methods=['GET', 'POST'])
 @login_required
@@ -106,8 +275,8 @@ def join_event():
         invite_code = request.form.get('invite_code')
         event = Event.query.filter_by(invite_code=invite_code).first()
         if event:
-            if current_user not in event.attendees:
-                event.attendees.append(current_user)
+            if not is_attendee(event.id, current_user.id):
+                db.session.execute(user_event.insert().values(user_id=current_user.id, event_id=event.id))
                 db.session.commit()
                 flash('Successfully joined the event!', 'success')
             else:
@@ -122,22 +291,114 @@ def join_event():
 def vote_song(song_id):
     song = Song.query.get_or_404(song_id)
     event = song.playlist.event
-    if current_user not in event.attendees and current_user != event.host:
+    if not can_access_event(event, current_user.id):
         flash('Not authorized to vote in this event.', 'danger')
         return redirect(url_for('views.dashboard'))
     
-    existing_vote = Vote.query.filter_by(user_id=current_user.id, song_id=song.id).first()
-    if existing_vote:
-        db.session.delete(existing_vote)
-        flash('Vote removed!', 'info')
-    else:
-        vote = Vote(user_id=current_user.id, song_id=song.id, event_id=event.id)
-        db.session.add(vote)
+    value, upvotes, downvotes = apply_votes(current_user.id, event.id, [(song.id, 'toggle')])[song.id]
+    publish_event_update(
+        event.id, 'vote',
+        song_id=song.id, spotify_track_id=song.spotify_track_id, upvotes=upvotes, downvotes=downvotes
+    )
+    if request_playlist_reorder(event.id) is not None:
+        db.session.commit()
+    if value == 1:
         flash('Vote added!', 'success')
-    
-    db.session.commit()
+    else:
+        flash('Vote removed!', 'info')
+
     return redirect(url_for('views.event', event_id=event.id))
 
+VOTE_ACTIONS = ('up', 'down', 'clear', 'toggle', 'toggle_down')
+
+def _vote_song_id(value):
+    # JSON clients may send ids as numbers or numeric strings; anything else
+    # (lists, objects, booleans, out-of-range numbers) is rejected.
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 < value < 2 ** 31:
+        return None
+    return value
+
+@views.route('/api/event/<int:event_id>/votes', methods=['POST'])
+@login_required
+def vote_batch(event_id):
+    event = Event.query.get_or_404(event_id)
+    if not can_access_event(event, current_user.id):
+        return jsonify({'error': 'Not authorized'}), 403
+
+    # {"votes": [{"song_id": 12, "action": "up"}, {"track_id": "...", "action": "toggle_down"}]}
+    payload = request.get_json(silent=True) or {}
+    entries = payload.get('votes')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'error': 'Expected a non-empty "votes" list'}), 400
+    if len(entries) > current_app.config['VOTE_BATCH_MAX']:
+        return jsonify({'error': f"At most {current_app.config['VOTE_BATCH_MAX']} votes per request"}), 400
+    if any(not isinstance(entry, dict) or entry.get('action') not in VOTE_ACTIONS for entry in entries):
+        return jsonify({'error': f"Each vote needs an action of {', '.join(VOTE_ACTIONS)}"}), 400
+
+    parsed = []
+    for entry in entries:
+        song_id = _vote_song_id(entry.get('song_id'))
+        track_id = entry.get('track_id')
+        if entry.get('song_id') is not None:
+            valid = song_id is not None
+        else:
+            valid = isinstance(track_id, str) and bool(track_id)
+        if not valid:
+            return jsonify({'error': 'Each vote needs an integer song_id or a string track_id', 'vote': entry}), 400
+        parsed.append((song_id, track_id, entry))
+
+    song_ids = {song_id for song_id, track_id, entry in parsed if song_id is not None}
+    track_ids = {track_id for song_id, track_id, entry in parsed if song_id is None}
+    songs = db.session.execute(
+        db.select(Song.id, Song.spotify_track_id).join(Playlist)
+        .where(Playlist.event_id == event.id, db.or_(Song.id.in_(song_ids), Song.spotify_track_id.in_(track_ids)))
+        .order_by(Song.id)
+    ).all()
+    track_ids_by_song = dict(songs)
+    songs_by_track = {}
+    for song_id, spotify_track_id in songs:
+        songs_by_track.setdefault(spotify_track_id, song_id)
+
+    # Votes for songs outside this event (e.g. tracks added on Spotify
+    # directly) are reported back rather than failing the whole batch.
+    changes = []
+    unknown = []
+    for song_id, track_id, entry in parsed:
+        if song_id is None:
+            song_id = songs_by_track.get(track_id)
+        if song_id not in track_ids_by_song:
+            unknown.append(entry)
+            continue
+        changes.append((song_id, entry['action']))
+
+    if not changes:
+        return jsonify({'event_id': event.id, 'votes': [], 'unknown': unknown})
+
+    results = apply_votes(current_user.id, event.id, changes)
+    votes = [
+        {
+            'song_id': song_id,
+            'spotify_track_id': track_ids_by_song[song_id],
+            'vote': value,
+            'upvotes': upvotes,
+            'downvotes': downvotes,
+            'score': wilson_score(upvotes, downvotes)
+        }
+        for song_id, (value, upvotes, downvotes) in results.items()
+    ]
+    for vote in votes:
+        publish_event_update(
+            event.id, 'vote',
+            song_id=vote['song_id'], spotify_track_id=vote['spotify_track_id'],
+            upvotes=vote['upvotes'], downvotes=vote['downvotes']
+        )
+    if request_playlist_reorder(event.id) is not None:
+        db.session.commit()
+
+    return jsonify({'event_id': event.id, 'votes': votes, 'unknown': unknown})
+
 @views.route('/search_songs')
 @login_required
 def search_songs():
@@ -145,47 +406,112 @@ def search_songs():
     event_id = request.args.get('event_id')
     event = Event.query.get_or_404(event_id)
     
-    if event.host_id != current_user.id and current_user not in event.attendees:
+    if not can_access_event(event, current_user.id):
         return jsonify({'error': 'Not authorized'}), 403
     
-    sp = get_spotify_client()
-    if sp:
-        results = sp.search(q=query, type='track', limit=10)
-        tracks = results['tracks']['items']
-    else:
-        tracks = []
-        flash('Unable to search songs. Please check your Spotify connection.', 'warning')
+    tracks = search_local_tracks(query, limit=10)
+    if len(tracks) < current_app.config['LOCAL_SEARCH_MIN_RESULTS']:
+        sp = get_spotify_client()
+        if sp:
+            try:
+                tracks = merge_tracks(tracks, search_tracks(sp, query, limit=10), 10)
+            except RateLimitExceeded:
+                # Local results only until Spotify has budget again.
+                flash(SPOTIFY_BUSY, 'warning')
+        elif not tracks:
+            flash('Unable to search songs. Please check your Spotify connection.', 'warning')
     
     return render_template('search_songs.html', tracks=tracks, event_id=event_id)
 
+@views.route('/typeahead')
+@login_required
+def typeahead():
+    query = request.args.get('query', '')
+    return jsonify({'tracks': search_local_tracks(query, limit=10)})
+
+def get_event_playlist(event):
+    if event.playlists:
+        return event.playlists[0]
+    playlist = Playlist(name=event.title, event_id=event.id)
+    db.session.add(playlist)
+    db.session.flush()
+    return playlist
+
 @views.route('/add_song/<int:event_id>/<string:track_id>', methods=['POST'])
 @login_required
 def add_song(event_id, track_id):
     event = Event.query.get_or_404(event_id)
-    if event.host_id != current_user.id and current_user not in event.attendees:
+    if not can_access_event(event, current_user.id):
         flash('You do not have permission to add songs to this event.', 'danger')
         return redirect(url_for('views.dashboard'))
     
     sp = get_spotify_client()
     if sp:
-        track = sp.track(track_id)
-        sp.user_playlist_add_tracks(current_user.id, event.spotify_playlist_id, [track_id])
-        
+        try:
+            track = get_track(track_id, sp)
+        except RateLimitExceeded:
+            flash(SPOTIFY_BUSY, 'warning')
+            return redirect(url_for('views.event', event_id=event_id))
+        if not track:
+            flash('Song not found on Spotify.', 'danger')
+            return redirect(url_for('views.event', event_id=event_id))
+
         new_song = Song(
-            title=track['name'],
-            artist=', '.join([artist['name'] for artist in track['artists']]),
+            title=track.title,
+            artist=track.artist,
             spotify_track_id=track_id,
-            playlist_id=event.playlist[0].id if event.playlist else None,
+            playlist_id=get_event_playlist(event).id,
             mood_id=event.mood_id
         )
         db.session.add(new_song)
+        db.session.flush()
+        # Written to Spotify by the job worker, batched with other adds.
+        request_playlist_add(event.id, new_song.id, track_id)
         db.session.commit()
+        register_song(event.id, new_song.id)
+        publish_event_update(
+            event.id, 'track_added',
+            song_id=new_song.id, spotify_track_id=track_id, title=new_song.title, artist=new_song.artist
+        )
         flash('Song added to the playlist!', 'success')
     else:
         flash('Unable to add song. Please check your Spotify connection.', 'warning')
     
     return redirect(url_for('views.event', event_id=event_id))
 
+def _metrics_denied(required=False):
+    # Operational endpoints are read by scrapers with the METRICS_TOKEN bearer
+    # token, not by logged-in users. required=True keeps an endpoint closed
+    # when no token is configured.
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        return Response('Not Found\n', status=404, mimetype='text/plain') if required else None
+    if request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return None
+
+@views.route('/spotify/pool_stats')
+def spotify_pool_stats():
+    denied = _metrics_denied(required=True)
+    if denied:
+        return denied
+    return jsonify(get_pool_stats())
+
+@views.route('/spotify/scheduler_stats')
+def spotify_scheduler_stats():
+    denied = _metrics_denied(required=True)
+    if denied:
+        return denied
+    return jsonify(get_scheduler().stats())
+
+@views.route('/metrics')
+def metrics():
+    # Scraped by Prometheus, so it is guarded by a bearer token rather than a login.
+    denied = _metrics_denied()
+    if denied:
+        return denied
+    return Response(spotify_metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @views.route('/profile')
 @login_required
 def profile():
@@ -203,28 +529,15 @@ def edit_profile():
         elif User.query.filter(User.email == email, User.id != current_user.id).first():
             flash('Email already in use.', 'danger')
         else:
-            current_user.username = username
-            current_user.email = email
-            db.session.commit()
-            flash('Profile updated successfully!', 'success')
-        
-        return redirect(url_for('views.profile'))
-    
-    return render_template('edit_profile.html', user=current_user)
-    if request.method == 'POST':
-        username = request.form.get('username')
-        email = request.form.get('email')
-        
-        if User.query.filter(User.username == username, User.id != current_user.id).first():
-            flash('Username already taken.', 'danger')
-        elif User.query.filter(User.email == email, User.id != current_user.id).first():
-            flash('Email already in use.', 'danger')
-        else:
-            current_user.username = username
-            current_user.email = email
+            # current_user is a cached snapshot, so the row is loaded to change it.
+            user = db.session.get(User, current_user.id)
+            user.username = username
+            user.email = email
             db.session.commit()
+            invalidate_user(user.id)
             flash('Profile updated successfully!', 'success')
         
         return redirect(url_for('views.profile'))
     
-    return render_template('edit_profile.html', user=current_user)
\ No newline at end of file
+    # The edit form is part of the profile page.
+    return redirect(url_for('views.profile'))
@@ -0,0 +1,530 @@
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from collections import defaultdict
+from .background import ensure_periodic
+from .cache import get_redis
+from .models import db, Playlist, Song, Vote
+import json
+import math
+import os
+import redis
+import time
+
+# Votes live in redis as two sets of voter ids per song, upvoters and
+# downvoters, and one sorted set of song ids per event ranked by score. Every
+# change is appended to a log that a background flusher applies to the vote
+# table in batches.
+#
+# A song's score is the lower bound of the Wilson interval on its share of
+# upvotes minus the same bound on its share of downvotes. A song at 40 up and
+# 2 down outranks one at 3 up and 0 down, an unvoted song scores 0, and any
+# song with more downvotes than upvotes scores below it. It is recomputed
+# from the two counts whenever a vote changes, never by a recount. The sorted
+# set doubles as the event's play queue: scores are negated and members
+# zero-padded song ids, so ascending order is best first and ties go to the
+# song added earliest.
+LOG_KEY = 'drolg:votes:log'
+PROCESSING_KEY = 'drolg:votes:processing'
+PROCESSING_ATTEMPTS_KEY = 'drolg:votes:processing:attempts'
+DEAD_LETTER_KEY = 'drolg:votes:dead'
+FLUSH_LOCK_KEY = 'drolg:votes:flush_lock'
+
+WILSON_Z = 1.959964
+# Scores are rounded so redis (which formats Lua numbers with 14 digits) and
+# the database rank identical counts identically.
+SCORE_FORMAT = '%.12f'
+
+# Applies a batch of changes from one voter atomically. ARGV holds the voter,
+# event, timestamp, Wilson z and score format, then a (song id, member,
+# action) triple per change whose upvoter set is KEYS[2n + 1] and downvoter
+# set KEYS[2n + 2]. Only changes that move a count are logged, as the vote's
+# new value.
+BATCH_SCRIPT = """
+local function lower_bound(k, n)
+    local z = tonumber(ARGV[4])
+    local p = k / n
+    return (p + z * z / (2 * n) - z * math.sqrt((p * (1 - p) + z * z / (4 * n)) / n)) / (1 + z * z / n)
+end
+
+local function wilson(up, down)
+    local n = up + down
+    if n == 0 then
+        return 0
+    end
+    return lower_bound(up, n) - lower_bound(down, n)
+end
+
+local results = {}
+for i = 1, (#KEYS - 2) / 2 do
+    local up_key = KEYS[i * 2 + 1]
+    local down_key = KEYS[i * 2 + 2]
+    local song_id = ARGV[i * 3 + 3]
+    local member = ARGV[i * 3 + 4]
+    local action = ARGV[i * 3 + 5]
+
+    local current = 0
+    if redis.call('SISMEMBER', up_key, ARGV[1]) == 1 then
+        current = 1
+    elseif redis.call('SISMEMBER', down_key, ARGV[1]) == 1 then
+        current = -1
+    end
+
+    local value = 0
+    if action == 'up' then
+        value = 1
+    elseif action == 'down' then
+        value = -1
+    elseif action == 'toggle' then
+        value = current == 1 and 0 or 1
+    elseif action == 'toggle_down' then
+        value = current == -1 and 0 or -1
+    end
+
+    local up = redis.call('SCARD', up_key)
+    local down = redis.call('SCARD', down_key)
+    if value ~= current then
+        if current == 1 then
+            redis.call('SREM', up_key, ARGV[1])
+            up = up - 1
+        elseif current == -1 then
+            redis.call('SREM', down_key, ARGV[1])
+            down = down - 1
+        end
+        if value == 1 then
+            redis.call('SADD', up_key, ARGV[1])
+            up = up + 1
+        elseif value == -1 then
+            redis.call('SADD', down_key, ARGV[1])
+            down = down + 1
+        end
+        redis.call('ZADD', KEYS[1], string.format(ARGV[5], -wilson(up, down)), member)
+        redis.call('RPUSH', KEYS[2], cjson.encode({
+            action = 'set',
+            value = value,
+            user_id = tonumber(ARGV[1]),
+            song_id = tonumber(song_id),
+            event_id = tonumber(ARGV[2]),
+            ts = tonumber(ARGV[3])
+        }))
+    end
+    results[#results + 1] = value
+    results[#results + 1] = up
+    results[#results + 1] = down
+end
+return results
+"""
+
+# Moves up to ARGV[1] log entries to the processing list in one step, so an
+# entry is always in exactly one of the two lists.
+TAKE_BATCH_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('RPUSH', KEYS[2], unpack(items))
+    redis.call('LTRIM', KEYS[1], #items, -1)
+end
+return items
+"""
+
+_scripts = {}
+
+def _script(client, source):
+    script = _scripts.get((id(client), source))
+    if script is None:
+        script = _scripts[(id(client), source)] = client.register_script(source)
+    return script
+
+def _song_key(song_id):
+    return f'drolg:votes:song:{song_id}'
+
+def _down_key(song_id):
+    return f'drolg:votes:song:{song_id}:down'
+
+def _event_key(event_id):
+    return f'drolg:votes:event:{event_id}'
+
+def _member(song_id):
+    return f'{song_id:012d}'
+
+def _loaded_key(event_id):
+    return f'drolg:votes:event:{event_id}:loaded'
+
+def _wilson_lower_bound(k, n):
+    z = WILSON_Z
+    p = k / n
+    return (p + z * z / (2 * n) - z * math.sqrt((p * (1 - p) + z * z / (4 * n)) / n)) / (1 + z * z / n)
+
+def wilson_score(upvotes, downvotes):
+    n = upvotes + downvotes
+    if n == 0:
+        return 0.0
+    score = _wilson_lower_bound(upvotes, n) - _wilson_lower_bound(downvotes, n)
+    return float(SCORE_FORMAT % score)
+
+def _next_value(action, current):
+    if action == 'up':
+        return 1
+    if action == 'down':
+        return -1
+    if action == 'toggle':
+        return 0 if current == 1 else 1
+    if action == 'toggle_down':
+        return 0 if current == -1 else -1
+    return 0
+
+def _pending_votes(client, event_id):
+    # Logged votes not yet flushed to the database, oldest first. Both lists
+    # are read in one transaction so an entry being moved between them is
+    # seen exactly once.
+    pipe = client.pipeline(transaction=True)
+    pipe.lrange(PROCESSING_KEY, 0, -1)
+    pipe.lrange(LOG_KEY, 0, -1)
+    processing, log = pipe.execute()
+    entries = (json.loads(item) for item in processing + log)
+    return [entry for entry in entries if entry.get('event_id') == event_id]
+
+def _hydrate(client, event_id):
+    # Loads an event's votes from the database, plus any still waiting in the
+    # log, when redis has not seen the event recently. The marker expires so
+    # redis is periodically rebuilt from the database, and is dropped early
+    # when a vote had to be written to the database directly.
+    if client.exists(_loaded_key(event_id)):
+        return
+
+    lock_key = _loaded_key(event_id) + ':lock'
+    if not client.set(lock_key, os.getpid(), nx=True, px=10000):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and not client.exists(_loaded_key(event_id)):
+            time.sleep(0.02)
+        return
+
+    try:
+        # Read before the database, so an entry flushed in between is in
+        # both and applied twice with the same value.
+        pending = _pending_votes(client, event_id)
+        song_ids = db.session.execute(
+            db.select(Song.id).join(Playlist).where(Playlist.event_id == event_id)
+        ).scalars().all()
+        values = {
+            (user_id, song_id): value
+            for user_id, song_id, value in db.session.execute(
+                db.select(Vote.user_id, Vote.song_id, Vote.value).where(Vote.event_id == event_id)
+            )
+        }
+        for entry in pending:
+            values[(entry['user_id'], entry['song_id'])] = entry['value']
+
+        upvoters = defaultdict(list)
+        downvoters = defaultdict(list)
+        for (user_id, song_id), value in values.items():
+            if value:
+                (upvoters if value > 0 else downvoters)[song_id].append(user_id)
+
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(_event_key(event_id))
+        for song_id in set(song_ids) | set(upvoters) | set(downvoters):
+            pipe.delete(_song_key(song_id), _down_key(song_id))
+            if upvoters[song_id]:
+                pipe.sadd(_song_key(song_id), *upvoters[song_id])
+            if downvoters[song_id]:
+                pipe.sadd(_down_key(song_id), *downvoters[song_id])
+            score = wilson_score(len(upvoters[song_id]), len(downvoters[song_id]))
+            pipe.zadd(_event_key(event_id), {_member(song_id): -score})
+        pipe.set(_loaded_key(event_id), 1, ex=current_app.config['VOTE_HYDRATE_TTL'])
+        pipe.execute()
+    finally:
+        client.delete(lock_key)
+
+def _update_tallies(deltas):
+    # deltas is {song_id: (upvote delta, downvote delta)}. The counters move
+    # atomically in SQL and the score is then derived from the new counts in
+    # the same transaction, which holds the row lock.
+    for song_id, (up, down) in deltas.items():
+        if up or down:
+            db.session.execute(
+                db.update(Song).where(Song.id == song_id)
+                .values(vote_count=Song.vote_count + up, downvotes=Song.downvotes + down)
+            )
+    changed = [song_id for song_id, (up, down) in deltas.items() if up or down]
+    if changed:
+        for song_id, upvotes, downvotes in db.session.execute(
+            db.select(Song.id, Song.vote_count, Song.downvotes).where(Song.id.in_(changed))
+        ).all():
+            db.session.execute(
+                db.update(Song).where(Song.id == song_id).values(score=wilson_score(upvotes, downvotes))
+            )
+
+def _tally_delta(old, new):
+    return (int(new == 1) - int(old == 1), int(new == -1) - int(old == -1))
+
+def _apply_in_db(user_id, event_id, changes):
+    song_ids = {song_id for song_id, action in changes}
+    before = dict(db.session.execute(
+        db.select(Vote.song_id, Vote.value).where(Vote.user_id == user_id, Vote.song_id.in_(song_ids))
+    ).all())
+    values = dict(before)
+    for song_id, action in changes:
+        values[song_id] = _next_value(action, values.get(song_id, 0))
+
+    deltas = {}
+    for song_id in song_ids:
+        old, new = before.get(song_id, 0), values[song_id]
+        if old == new:
+            continue
+        if new == 0:
+            db.session.execute(db.delete(Vote).where(Vote.user_id == user_id, Vote.song_id == song_id))
+        elif old == 0:
+            db.session.add(Vote(user_id=user_id, song_id=song_id, event_id=event_id, value=new))
+        else:
+            db.session.execute(
+                db.update(Vote).where(Vote.user_id == user_id, Vote.song_id == song_id).values(value=new)
+            )
+        deltas[song_id] = _tally_delta(old, new)
+    _update_tallies(deltas)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request from the same voter got there first; its
+        # votes stand and the tallies below reflect them.
+        db.session.rollback()
+        values = dict(db.session.execute(
+            db.select(Vote.song_id, Vote.value).where(Vote.user_id == user_id, Vote.song_id.in_(song_ids))
+        ).all())
+
+    tallies = _tallies_in_db(song_ids)
+    return {song_id: (values.get(song_id, 0),) + tallies.get(song_id, (0, 0)) for song_id in song_ids}
+
+def apply_votes(user_id, event_id, changes):
+    # changes is [(song_id, action)] with action 'up', 'down', 'clear',
+    # 'toggle' (the upvote) or 'toggle_down', applied in order as one unit.
+    # Returns {song_id: (value, upvotes, downvotes)}, value being 1, -1 or 0.
+    if not changes:
+        return {}
+    client = get_redis()
+    if client is not None:
+        try:
+            _hydrate(client, event_id)
+            keys = [_event_key(event_id), LOG_KEY]
+            args = [user_id, event_id, int(time.time()), WILSON_Z, SCORE_FORMAT]
+            for song_id, action in changes:
+                keys.extend([_song_key(song_id), _down_key(song_id)])
+                args.extend([song_id, _member(song_id), action])
+            results = _script(client, BATCH_SCRIPT)(keys=keys, args=args)
+            _ensure_flusher()
+            # Later changes to the same song overwrite earlier ones.
+            return {
+                song_id: tuple(int(result) for result in results[i * 3:i * 3 + 3])
+                for i, (song_id, action) in enumerate(changes)
+            }
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Redis vote engine unavailable, voting in the database: {str(e)}")
+    results = _apply_in_db(user_id, event_id, changes)
+    if client is not None:
+        # Redis no longer matches the database for this event. If it is still
+        # down, the marker's expiry brings the event back in line instead.
+        try:
+            client.delete(_loaded_key(event_id))
+        except redis.RedisError:
+            pass
+    return results
+
+def _tallies_in_db(song_ids):
+    return {
+        song_id: (upvotes, downvotes)
+        for song_id, upvotes, downvotes in db.session.execute(
+            db.select(Song.id, Song.vote_count, Song.downvotes).where(Song.id.in_(song_ids))
+        ).all()
+    } if song_ids else {}
+
+def get_tallies(event_id, song_ids):
+    # {song_id: (upvotes, downvotes)} for the given songs of one event.
+    song_ids = list(song_ids)
+    client = get_redis()
+    if client is not None and song_ids:
+        try:
+            _hydrate(client, event_id)
+            pipe = client.pipeline(transaction=False)
+            for song_id in song_ids:
+                pipe.scard(_song_key(song_id))
+                pipe.scard(_down_key(song_id))
+            counts = pipe.execute()
+            return {song_id: (counts[i * 2], counts[i * 2 + 1]) for i, song_id in enumerate(song_ids)}
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Redis vote engine unavailable: {str(e)}")
+    return _tallies_in_db(song_ids)
+
+def get_event_tallies(event_id):
+    client = get_redis()
+    if client is not None:
+        try:
+            _hydrate(client, event_id)
+            _ensure_flusher()
+            return get_tallies(event_id, [int(member) for member in client.zrange(_event_key(event_id), 0, -1)])
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Redis vote engine unavailable: {str(e)}")
+    return {
+        song_id: (upvotes, downvotes)
+        for song_id, upvotes, downvotes in db.session.execute(
+            db.select(Song.id, Song.vote_count, Song.downvotes).join(Playlist).where(Playlist.event_id == event_id)
+        ).all()
+    }
+
+def register_song(event_id, song_id):
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        # Before hydration the song is picked up from the database instead.
+        if client.exists(_loaded_key(event_id)):
+            client.zadd(_event_key(event_id), {_member(song_id): 0}, nx=True)
+    except redis.RedisError as e:
+        current_app.logger.warning(f"Redis vote engine unavailable: {str(e)}")
+
+def _ranked_in_db(event_id):
+    return (
+        db.select(Song.id, Song.score)
+        .join(Playlist)
+        .where(Playlist.event_id == event_id)
+        .order_by(Song.score.desc(), Song.id)
+    )
+
+def ranked_songs(event_id, start=0, count=10):
+    # [(song_id, score)] in queue order, O(log n + count) in redis.
+    # count=None returns the rest of the queue.
+    client = get_redis()
+    if client is not None:
+        try:
+            _hydrate(client, event_id)
+            end = -1 if count is None else start + count - 1
+            return [
+                (int(member), -score or 0.0)
+                for member, score in client.zrange(_event_key(event_id), start, end, withscores=True)
+            ]
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Redis vote engine unavailable: {str(e)}")
+    stmt = _ranked_in_db(event_id).offset(start)
+    if count is not None:
+        stmt = stmt.limit(count)
+    return [tuple(row) for row in db.session.execute(stmt).all()]
+
+def song_rank(event_id, song_id):
+    # Zero-based position of the song in the queue, or None if not queued.
+    client = get_redis()
+    if client is not None:
+        try:
+            _hydrate(client, event_id)
+            return client.zrank(_event_key(event_id), _member(song_id))
+        except redis.RedisError as e:
+            current_app.logger.warning(f"Redis vote engine unavailable: {str(e)}")
+
+    song = db.session.execute(
+        db.select(Song.id, Song.score).join(Playlist)
+        .where(Playlist.event_id == event_id, Song.id == song_id)
+    ).first()
+    if song is None:
+        return None
+    return db.session.execute(
+        db.select(db.func.count(Song.id)).join(Playlist)
+        .where(
+            Playlist.event_id == event_id,
+            db.or_(
+                Song.score > song.score,
+                db.and_(Song.score == song.score, Song.id < song.id)
+            )
+        )
+    ).scalar()
+
+def apply_vote_log(entries):
+    # Entries carry the vote's new value rather than a change, so replaying
+    # a batch is harmless: rows are written only where they differ. Votes for
+    # songs deleted since (delete_event bulk-deletes them) are dropped.
+    song_ids = {entry['song_id'] for entry in entries}
+    existing = set(db.session.execute(db.select(Song.id).where(Song.id.in_(song_ids))).scalars())
+    entries = [entry for entry in entries if entry['song_id'] in existing]
+    if not entries:
+        return
+
+    pairs = {(entry['user_id'], entry['song_id']) for entry in entries}
+    before = {
+        (user_id, song_id): value
+        for user_id, song_id, value in db.session.execute(
+            db.select(Vote.user_id, Vote.song_id, Vote.value)
+            .where(db.tuple_(Vote.user_id, Vote.song_id).in_(pairs))
+        ).all()
+    }
+    after = dict(before)
+    event_ids = {}
+    for entry in entries:
+        after[(entry['user_id'], entry['song_id'])] = entry['value']
+        event_ids[entry['song_id']] = entry['event_id']
+
+    deltas = defaultdict(lambda: (0, 0))
+    for (user_id, song_id), new in after.items():
+        old = before.get((user_id, song_id), 0)
+        if old == new:
+            continue
+        if new == 0:
+            db.session.execute(db.delete(Vote).where(Vote.user_id == user_id, Vote.song_id == song_id))
+        elif old == 0:
+            db.session.add(Vote(user_id=user_id, song_id=song_id, event_id=event_ids[song_id], value=new))
+        else:
+            db.session.execute(
+                db.update(Vote).where(Vote.user_id == user_id, Vote.song_id == song_id).values(value=new)
+            )
+        up, down = _tally_delta(old, new)
+        deltas[song_id] = (deltas[song_id][0] + up, deltas[song_id][1] + down)
+    _update_tallies(deltas)
+    db.session.commit()
+
+def flush_votes(app):
+    client = get_redis(app)
+    if client is None:
+        return 0
+
+    batch_size = app.config['VOTE_FLUSH_BATCH']
+    if not client.set(FLUSH_LOCK_KEY, os.getpid(), nx=True, px=60000):
+        return 0
+
+    flushed = 0
+    try:
+        # Entries left in the processing list belong to a flusher that died
+        # before deleting them; replay those first.
+        items = client.lrange(PROCESSING_KEY, 0, -1)
+        if items:
+            app.logger.info(f"Replaying {len(items)} unacknowledged vote(s)")
+        else:
+            items = _script(client, TAKE_BATCH_SCRIPT)(keys=[LOG_KEY, PROCESSING_KEY], args=[batch_size])
+
+        while items:
+            try:
+                apply_vote_log([json.loads(item) for item in items])
+            except Exception:
+                db.session.rollback()
+                _record_failed_batch(app, client, items)
+                raise
+            client.delete(PROCESSING_KEY, PROCESSING_ATTEMPTS_KEY)
+            client.pexpire(FLUSH_LOCK_KEY, 60000)
+            flushed += len(items)
+            items = _script(client, TAKE_BATCH_SCRIPT)(keys=[LOG_KEY, PROCESSING_KEY], args=[batch_size])
+    finally:
+        client.delete(FLUSH_LOCK_KEY)
+    return flushed
+
+def _record_failed_batch(app, client, items):
+    # A batch that keeps failing would otherwise be replayed forever and
+    # hold back every vote logged after it.
+    attempts = client.incr(PROCESSING_ATTEMPTS_KEY)
+    if attempts < app.config['VOTE_FLUSH_MAX_ATTEMPTS']:
+        return
+    pipe = client.pipeline()
+    pipe.rpush(DEAD_LETTER_KEY, *items)
+    pipe.delete(PROCESSING_KEY, PROCESSING_ATTEMPTS_KEY)
+    pipe.execute()
+    app.logger.error(f"Moved {len(items)} vote(s) to {DEAD_LETTER_KEY} after {attempts} failed flushes")
+
+def _ensure_flusher():
+    ensure_periodic(
+        current_app._get_current_object(),
+        'vote-flusher',
+        current_app.config['VOTE_FLUSH_INTERVAL'],
+        flush_votes
+    )
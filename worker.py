@@ -0,0 +1,7 @@
+from website import create_app
+from website.jobs import run_worker
+
+app = create_app()
+
+if __name__ == '__main__':
+    run_worker(app)